@@ -0,0 +1,84 @@
+"""Importing comments and likes: one request per item vs the bulk endpoints.
+
+Calls the app in-process against the test database, which rolls everything
+back on disconnect. Each item goes through routing, validation and
+authentication once per request, then its own queries, so the gap shows
+the per-request and per-query overhead the bulk endpoints remove.
+
+    ENV_STATE=test python -m benchmarks.bench_bulk_create [items]
+"""
+
+import asyncio
+import sys
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from blogapi.core.security import create_access_token
+from blogapi.database.database import database, post_table, user_table
+from blogapi.main import app
+from blogapi.routers.post import MAX_BULK_ITEMS
+
+
+async def timed(label: str, items: int, run) -> None:
+    started = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:>18} {elapsed * 1000:>9.1f}ms {items / elapsed:>9.0f}/s")
+
+
+async def main(items: int) -> None:
+    await database.connect()
+    try:
+        user_id = await database.execute(
+            user_table.insert().values(
+                email="bench@example.com", password="", confirmed=True
+            )
+        )
+        posts = await database.fetch_all(
+            post_table.insert()
+            .values(
+                [{"body": f"Post {i}", "user_id": user_id} for i in range(2 * items)]
+            )
+            .returning(post_table.c.id)
+        )
+        headers = {
+            "Authorization": f"Bearer {create_access_token('bench@example.com')}"
+        }
+        post_ids = [post["id"] for post in posts]
+        comments = [{"body": f"Comment {i}", "post_id": i} for i in post_ids[:items]]
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://bench", headers=headers
+        ) as client:
+
+            async def comment_each() -> None:
+                for comment in comments:
+                    await client.post("/comment", json=comment)
+
+            async def comment_bulk() -> None:
+                for start in range(0, items, MAX_BULK_ITEMS):
+                    chunk = comments[start : start + MAX_BULK_ITEMS]
+                    await client.post("/comment/bulk", json=chunk)
+
+            async def like_each() -> None:
+                for post_id in post_ids[:items]:
+                    await client.post("/like", json={"post_id": post_id})
+
+            async def like_bulk() -> None:
+                likes = [{"post_id": post_id} for post_id in post_ids[items:]]
+                for start in range(0, items, MAX_BULK_ITEMS):
+                    chunk = likes[start : start + MAX_BULK_ITEMS]
+                    await client.post("/like/bulk", json=chunk)
+
+            print(f"{items} items")
+            await timed("comments, each", items, comment_each)
+            await timed("comments, bulk", items, comment_bulk)
+            await timed("likes, each", items, like_each)
+            await timed("likes, bulk", items, like_bulk)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,70 @@
+"""Registration email throughput: one Mailgun call per email vs the outbox.
+
+Runs against the in-process fake Mailgun server with a simulated API
+latency, so the numbers show how many calls and how much waiting batching
+saves rather than anything about the real network.
+
+    ENV_STATE=test python -m benchmarks.bench_email_outbox [emails] [latency_ms]
+"""
+
+import asyncio
+import sys
+import time
+
+from blogapi.core.config import config
+from blogapi.core.http_clients import http_clients
+from blogapi.service_tasks.email_outbox import EmailOutbox
+from blogapi.service_tasks.tasks import send_batch_email, send_simple_email
+from blogapi.tests.fake_mailgun import FakeMailgun
+
+# Mailgun's default per-domain concurrency is low; mirror a modest limit
+CONCURRENCY = 10
+
+
+async def per_email(emails: int) -> None:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def send(i: int) -> None:
+        async with semaphore:
+            await send_simple_email(f"user{i}@example.com", "Subject", f"Hi {i}")
+
+    await asyncio.gather(*(send(i) for i in range(emails)))
+
+
+async def batched(emails: int) -> None:
+    outbox = EmailOutbox(send_batch_email, window=0.05)
+    await asyncio.gather(
+        *(
+            outbox.send(f"user{i}@example.com", "Subject", "Hi %recipient.i%", {"i": i})
+            for i in range(emails)
+        )
+    )
+
+
+async def run(name: str, bench, emails: int, latency: float) -> None:
+    fake = FakeMailgun(latency=latency)
+    http_clients.get = lambda upstream: fake.client()
+
+    started = time.perf_counter()
+    await bench(emails)
+    elapsed = time.perf_counter() - started
+
+    assert len(fake.delivered) == emails
+    print(
+        f"{name:>10}: {emails} emails in {elapsed:.2f}s "
+        f"({emails / elapsed:,.0f}/s, {fake.requests} API calls)"
+    )
+
+
+async def main(emails: int, latency: float) -> None:
+    config.MAILGUN_DOMAIN = config.MAILGUN_DOMAIN or "example.com"
+    config.MAILGUN_API_KEY = config.MAILGUN_API_KEY or "key"
+
+    await run("per email", per_email, emails, latency)
+    await run("outbox", batched, emails, latency)
+
+
+if __name__ == "__main__":
+    emails = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(main(emails, latency_ms / 1000))
@@ -0,0 +1,96 @@
+"""Many users liking one hot post: a write per like vs the write-behind buffer.
+
+Calls POST /like in-process against the test database, which rolls
+everything back on disconnect, with CONCURRENCY requests in flight. The
+buffered run includes the final flush, so both write every like.
+
+    ENV_STATE=test python -m benchmarks.bench_like_buffer [likes]
+"""
+
+import asyncio
+import sys
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from blogapi.core.config import config
+from blogapi.core.security import create_access_token
+from blogapi.database.database import database, post_table, user_table
+from blogapi.main import app
+from blogapi.routers.post import like_buffer
+
+CONCURRENCY = 50
+
+
+async def like_all(client: AsyncClient, tokens: list[str], post_id: int) -> None:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def like(token: str) -> None:
+        async with semaphore:
+            await client.post(
+                "/like",
+                json={"post_id": post_id},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+
+    await asyncio.gather(*(like(token) for token in tokens))
+
+
+async def timed(label: str, likes: int, run) -> None:
+    started = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:>14} {elapsed * 1000:>9.1f}ms {likes / elapsed:>9.0f}/s")
+
+
+async def main(likes: int) -> None:
+    await database.connect()
+    try:
+        emails = [f"bench{i}@example.com" for i in range(likes)]
+        users = await database.fetch_all(
+            user_table.insert()
+            .values(
+                [
+                    {"email": email, "password": "", "confirmed": True}
+                    for email in emails
+                ]
+            )
+            .returning(user_table.c.id)
+        )
+        posts = await database.fetch_all(
+            post_table.insert()
+            .values([{"body": "Hot post", "user_id": users[0]["id"]}] * 2)
+            .returning(post_table.c.id)
+        )
+        tokens = [create_access_token(email) for email in emails]
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://bench"
+        ) as client:
+
+            async def direct() -> None:
+                await like_all(client, tokens, posts[0]["id"])
+
+            async def buffered() -> None:
+                config.LIKE_WRITE_BEHIND = True
+                try:
+                    await like_all(client, tokens, posts[1]["id"])
+                    await like_buffer.flush()
+                finally:
+                    config.LIKE_WRITE_BEHIND = False
+
+            print(f"{likes} likes, {CONCURRENCY} in flight")
+            await timed("direct", likes, direct)
+            await timed("write-behind", likes, buffered)
+            print(f"{like_buffer.stats()['batches_written']} batches written")
+
+        counts = await database.fetch_all(
+            post_table.select().where(post_table.c.id.in_([p["id"] for p in posts]))
+        )
+        assert all(post["like_count"] == likes for post in counts)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
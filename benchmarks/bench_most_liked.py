@@ -0,0 +1,87 @@
+"""Latency of most_likes feed pages with and without ix_posts_like_count_id.
+
+Fills the posts table of the test database with random like counts inside a
+transaction, times the first page and a page deep into the feed, drops the
+index and times them again. The transaction is rolled back at the end, so
+nothing is left behind.
+
+    ENV_STATE=test python -m benchmarks.bench_most_liked [posts] [calls]
+"""
+
+import asyncio
+import sys
+import time
+
+from databases import Database
+
+from blogapi.core.config import config
+from blogapi.core.pagination import DEFAULT_PAGE_SIZE
+from blogapi.routers.post import PostSorting, feed_statements
+
+first_page = feed_statements[(PostSorting.most_likes, False)]
+next_page = feed_statements[(PostSorting.most_likes, True)]
+
+
+async def per_call_ms(database: Database, statement, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await database.fetch_all(statement)
+    return (time.perf_counter() - started) / calls * 1000
+
+
+async def measure(database: Database, posts: int, calls: int) -> dict[str, float]:
+    fetch = DEFAULT_PAGE_SIZE + 1
+    # A cursor halfway down the feed
+    middle = await database.fetch_one(
+        "SELECT id, like_count FROM posts ORDER BY like_count DESC, id DESC "
+        "OFFSET :offset LIMIT 1",
+        {"offset": posts // 2},
+    )
+    return {
+        "first page": await per_call_ms(database, first_page.bind(fetch=fetch), calls),
+        "middle page": await per_call_ms(
+            database,
+            next_page.bind(
+                after_id=middle["id"], after_likes=middle["like_count"], fetch=fetch
+            ),
+            calls,
+        ),
+    }
+
+
+async def main(posts: int, calls: int) -> None:
+    database = Database(config.DATABASE_URL, force_rollback=True)
+    await database.connect()
+    try:
+        await database.execute(
+            "INSERT INTO users (email, password, confirmed) "
+            "VALUES ('bench@example.com', '', true)"
+        )
+        await database.execute(
+            "INSERT INTO posts (body, user_id, like_count) "
+            "SELECT 'Post ' || i, (SELECT max(id) FROM users), "
+            "(random() * 1000)::int FROM generate_series(1, :posts) AS i",
+            {"posts": posts},
+        )
+        await database.execute("ANALYZE posts")
+
+        indexed = await measure(database, posts, calls)
+        await database.execute("DROP INDEX ix_posts_like_count_id")
+        await database.execute("ANALYZE posts")
+        unindexed = await measure(database, posts, calls)
+    finally:
+        await database.disconnect()
+
+    print(f"{posts} posts, {calls} calls each")
+    print(f"{'page':>12} {'no index':>10} {'index':>10}")
+    for name in indexed:
+        print(f"{name:>12} {unindexed[name]:>8.2f}ms {indexed[name]:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+        )
+    )
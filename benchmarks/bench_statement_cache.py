@@ -0,0 +1,73 @@
+"""CPU spent turning hot queries into SQL, rebuilt per call vs cached.
+
+Measures what `databases` does before a query reaches asyncpg: build the
+SQLAlchemy expression and compile it for the asyncpg dialect, or bind
+values to a CachedStatement that was compiled once. No queries are sent.
+
+    ENV_STATE=test python -m benchmarks.bench_statement_cache [calls]
+"""
+
+import sys
+import timeit
+
+from databases.backends.postgres import PostgresBackend
+
+from blogapi.core.deps import user_by_email_statement
+from blogapi.database.database import post_table, user_table
+from blogapi.routers.post import (
+    PostSorting,
+    comments_statements,
+    feed_statements,
+    find_post_statement,
+    post_with_comments_statement,
+    select_comments,
+    select_feed_page,
+    select_post_with_comments,
+)
+
+connection = PostgresBackend("postgresql://localhost/bench").connection()
+
+queries = {
+    "find_post": (
+        lambda: post_table.select().where(post_table.c.id == 42),
+        lambda: find_post_statement.bind(post_id=42),
+    ),
+    "get_user": (
+        lambda: user_table.select().where(user_table.c.email == "test@example.com"),
+        lambda: user_by_email_statement.bind(email="test@example.com"),
+    ),
+    "comments_after": (
+        lambda: select_comments(42, 100).limit(21),
+        lambda: comments_statements[True].bind(post_id=42, after_id=100, fetch=21),
+    ),
+    "feed_most_likes": (
+        lambda: select_feed_page(PostSorting.most_likes, True).params(
+            after_id=100, after_likes=3, fetch=21
+        ),
+        lambda: feed_statements[(PostSorting.most_likes, True)].bind(
+            after_id=100, after_likes=3, fetch=21
+        ),
+    ),
+    "post_with_comments": (
+        lambda: select_post_with_comments().params(post_id=42),
+        lambda: post_with_comments_statement.bind(post_id=42),
+    ),
+}
+
+
+def per_call_us(build, calls: int) -> float:
+    return (
+        timeit.timeit(lambda: connection._compile(build()), number=calls) / calls * 1e6
+    )
+
+
+def main(calls: int) -> None:
+    print(f"{'query':>20} {'rebuilt':>10} {'cached':>10} {'saved':>10}")
+    for name, (rebuilt, cached) in queries.items():
+        before = per_call_us(rebuilt, calls)
+        after = per_call_us(cached, calls)
+        print(f"{name:>20} {before:>8.1f}us {after:>8.1f}us {before - after:>8.1f}us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
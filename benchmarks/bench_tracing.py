@@ -0,0 +1,79 @@
+"""Request overhead of tracing every request vs the adaptive traces sampler.
+
+Calls GET /post in-process against the test database, with Sentry sending
+to a transport that drops everything, so only the cost of recording and
+serialising traces shows. Each run sends requests as fast as it can, far
+above the traces per second budget.
+
+    ENV_STATE=test python -m benchmarks.bench_tracing [requests]
+"""
+
+import asyncio
+import sys
+import time
+
+import sentry_sdk
+from httpx import ASGITransport, AsyncClient
+from sentry_sdk.transport import Transport
+
+from blogapi.core.tracing import AdaptiveSampler, traces_sampler
+from blogapi.database.database import database
+from blogapi.main import app
+
+DSN = "https://key@sentry.example.com/1"
+
+
+class CountingTransport(Transport):
+    def __init__(self, options=None) -> None:
+        super().__init__(options)
+        self.transactions = 0
+
+    def capture_envelope(self, envelope) -> None:
+        if envelope.get_transaction_event() is not None:
+            self.transactions += 1
+
+
+async def timed(label: str, requests: int, client: AsyncClient, **options) -> None:
+    transport = CountingTransport()
+    sentry_sdk.init(dsn=DSN, transport=transport, **options)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await client.get("/post")
+    elapsed = time.perf_counter() - started
+    sentry_sdk.get_client().close()
+    print(
+        f"{label:>10} {elapsed * 1000:>9.1f}ms {requests / elapsed:>7.0f}/s "
+        f"{transport.transactions:>6} traces"
+    )
+
+
+async def main(requests: int) -> None:
+    await database.connect()
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://bench"
+        ) as client:
+            # Warm up connections and caches first
+            for _ in range(100):
+                await client.get("/post")
+
+            print(f"{requests} requests")
+            await timed("untraced", requests, client)
+            await timed("full rate", requests, client, traces_sample_rate=1.0)
+
+            sampler = AdaptiveSampler(
+                default_rate=1.0,
+                route_rates={},
+                target_per_second=10,
+                slow_threshold=1,
+                boost_for=60,
+                window=0.5,
+            )
+            sampler.routes = traces_sampler.routes
+            await timed("adaptive", requests, client, traces_sampler=sampler)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000))
@@ -1,14 +1,34 @@
 import logging
 from typing import Annotated, Literal
 
-from fastapi import Depends, HTTPException, status
+import sqlalchemy
+from databases import Database
+from fastapi import Depends, HTTPException, Request, status
 from jose import ExpiredSignatureError, JWTError, jwt
 
-from blogapi.core.security import ALGORITHM, SECRET_KEY, oauth2_scheme, verify_password
-from blogapi.database.database import database, user_table
+from blogapi.core.cache import TTLCache
+from blogapi.core.config import config
+from blogapi.core.security import (
+    ALGORITHM,
+    SECRET_KEY,
+    oauth2_scheme,
+    verify_password_async,
+)
+from blogapi.database.database import database, replica_router, user_table
+from blogapi.database.replica import PRIMARY_UNTIL_COOKIE, ReplicaRouter
+from blogapi.database.statements import CachedStatement
 
 logger = logging.getLogger(__name__)
 
+# Users looked up by get_current_user, keyed by the token subject (email).
+# Anything that updates a user must pop it from here.
+user_cache = TTLCache(config.USER_CACHE_MAX_SIZE, config.USER_CACHE_TTL)
+
+user_by_email_statement = CachedStatement(
+    "user_by_email",
+    user_table.select().where(user_table.c.email == sqlalchemy.bindparam("email")),
+)
+
 
 def create_credentials_exception(detail: str) -> HTTPException:
     return HTTPException(
@@ -43,8 +63,7 @@ def get_subject_for_token_type(
 
 async def get_user(email: str):
     logger.debug("Fetching user from the database", extra={"email": email})
-    query = user_table.select().where(user_table.c.email == email)
-    result = await database.fetch_one(query)
+    result = await database.fetch_one(user_by_email_statement.bind(email=email))
 
     if result:
         return result
@@ -55,7 +74,7 @@ async def authenticate_user(email: str, password: str):
     user = await get_user(email)
     if not user:
         raise create_credentials_exception("Invalid email or password.")
-    if not verify_password(password, user["password"]):
+    if not await verify_password_async(password, user["password"]):
         raise create_credentials_exception("Invalid email or password.")
     if not user["confirmed"]:
         raise create_credentials_exception("User has not confirmed email")
@@ -66,7 +85,18 @@ async def authenticate_user(email: str, password: str):
 # Decode the token and return the user
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     email = get_subject_for_token_type(token, "access")
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+
     user = await get_user(email=email)
     if user is None:
         raise create_credentials_exception("Could not find user for this token")
+
+    user_cache.set(email, user)
     return user
+
+
+def get_read_database(request: Request) -> Database | ReplicaRouter:
+    """Where a GET endpoint should run its reads, see ReplicaRouter."""
+    return replica_router.for_read(request.cookies.get(PRIMARY_UNTIL_COOKIE))
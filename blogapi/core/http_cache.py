@@ -0,0 +1,41 @@
+import hashlib
+
+from fastapi import Request, Response, status
+
+from blogapi.core.config import config
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag for a representation fully determined by `parts`."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def cache_control() -> str:
+    directives = ["public", f"max-age={config.HTTP_CACHE_MAX_AGE}"]
+    if config.HTTP_CACHE_STALE_WHILE_REVALIDATE:
+        directives.append(
+            f"stale-while-revalidate={config.HTTP_CACHE_STALE_WHILE_REVALIDATE}"
+        )
+    return ", ".join(directives)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def set_cache_headers(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control()
+
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_cache_headers(response, etag)
+    return response
@@ -0,0 +1,99 @@
+import logging
+import time
+from dataclasses import dataclass
+
+import httpx
+
+from blogapi.core.config import config
+from blogapi.core.metrics import upstream_request_duration
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Upstream:
+    base_url: str
+    timeout: float
+    max_connections: int
+    connect_timeout: float = 5.0
+    keepalive_expiry: float = 30.0
+
+
+class TimedTransport(httpx.AsyncHTTPTransport):
+    """Records how long each call to the upstream takes, errors included."""
+
+    def __init__(self, upstream: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await super().handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            upstream_request_duration.observe(
+                time.perf_counter() - started, self.upstream, status
+            )
+
+
+class HTTPClients:
+    """Shared httpx clients, one connection pool per upstream.
+
+    Clients are opened by the app lifespan, or lazily on first use in
+    processes that don't run it, and kept alive so calls reuse connections
+    instead of paying a TLS handshake each time.
+    """
+
+    def __init__(self, upstreams: dict[str, Upstream]) -> None:
+        self.upstreams = upstreams
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def _create(self, name: str, upstream: Upstream) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=upstream.base_url,
+            timeout=httpx.Timeout(upstream.timeout, connect=upstream.connect_timeout),
+            # Connection limits belong to the transport when one is given
+            transport=TimedTransport(
+                name,
+                limits=httpx.Limits(
+                    max_connections=upstream.max_connections,
+                    max_keepalive_connections=upstream.max_connections,
+                    keepalive_expiry=upstream.keepalive_expiry,
+                ),
+            ),
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            logger.debug("Opening HTTP client for %s", name)
+            client = self._clients[name] = self._create(name, self.upstreams[name])
+        return client
+
+    def open(self) -> None:
+        for name in self.upstreams:
+            self.get(name)
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+http_clients = HTTPClients(
+    {
+        "mailgun": Upstream(
+            base_url="https://api.mailgun.net/v3",
+            timeout=config.MAILGUN_TIMEOUT,
+            max_connections=config.MAILGUN_MAX_CONNECTIONS,
+        ),
+        "deepai": Upstream(
+            base_url="https://api.deepai.org/api",
+            timeout=config.DEEPAI_TIMEOUT,
+            max_connections=config.DEEPAI_MAX_CONNECTIONS,
+        ),
+    }
+)
@@ -1,5 +1,13 @@
+import copy
 import logging
+import queue
+import random
+import threading
+import time
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+
+from asgi_correlation_id import CorrelationIdFilter
 
 from blogapi.core.config import DevConfig, config
 
@@ -21,6 +29,186 @@ class EmailObfuscationFilter(logging.Filter):
         return True
 
 
+class SamplingFilter(logging.Filter):
+    """Lets through a sample of a logger's records, up to a rate limit.
+
+    `rate` is the fraction of records kept and `max_per_second` caps how many
+    are kept per second (0 for no cap), so a chatty logger can stay on
+    under load. Warnings and errors are always kept.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        rate: float = 1.0,
+        max_per_second: float = 0,
+        timer=time.monotonic,
+    ) -> None:
+        super().__init__(name)
+        self.rate = rate
+        self.max_per_second = max_per_second
+        self.timer = timer
+        self.dropped = 0
+        self._tokens = max_per_second
+        self._updated = timer()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.rate < 1 and random.random() >= self.rate:
+            self.dropped += 1
+            return False
+        if self.max_per_second and not self._take_token():
+            self.dropped += 1
+            return False
+        return True
+
+    def _take_token(self) -> bool:
+        with self._lock:
+            now = self.timer()
+            self._tokens = min(
+                self.max_per_second,
+                self._tokens + (now - self._updated) * self.max_per_second,
+            )
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def configure_sampling(
+    sample_rates: dict[str, float], rate_limits: dict[str, float]
+) -> None:
+    for name in sample_rates.keys() | rate_limits.keys():
+        logger = logging.getLogger(name)
+        for existing in logger.filters[:]:
+            if isinstance(existing, SamplingFilter):
+                logger.removeFilter(existing)
+        logger.addFilter(
+            SamplingFilter(
+                rate=sample_rates.get(name, 1.0),
+                max_per_second=rate_limits.get(name, 0),
+            )
+        )
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hands records to a QueueListener thread instead of handling them.
+
+    Runs the filters that need the caller's context (the correlation id lives
+    in a contextvar) and enqueues the record together with the handlers it is
+    meant for. Formatting is left to the listener. When the queue is full the
+    drop policy decides what gives, and the number of dropped records is
+    logged once there is room again.
+    """
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        targets: list[logging.Handler],
+        drop_policy: str = "drop_new",
+    ) -> None:
+        super().__init__(log_queue)
+        self.targets = tuple(targets)
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler.prepare, don't format here, the record never
+        # leaves the process
+        record = copy.copy(record)
+        record.log_targets = self.targets
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.drop_policy == "block":
+            self.queue.put(record)
+            return
+
+        if self._unreported:
+            reported = self._unreported
+            if self._put(self._dropped_record(record, reported)):
+                self._unreported -= reported
+        if not self._put(record):
+            self.dropped += 1
+            self._unreported += 1
+
+    def _put(self, record: logging.LogRecord) -> bool:
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            if self.drop_policy != "drop_oldest":
+                return False
+
+        try:
+            self.queue.get_nowait()
+            self.dropped += 1
+            self._unreported += 1
+            self.queue.put_nowait(record)
+            return True
+        except (queue.Empty, queue.Full):
+            return False
+
+    def _dropped_record(
+        self, record: logging.LogRecord, count: int
+    ) -> logging.LogRecord:
+        dropped = logging.makeLogRecord(
+            {
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Log queue full, dropped {count} records",
+                "correlation_id": getattr(record, "correlation_id", "-"),
+            }
+        )
+        dropped.log_targets = self.targets
+        return dropped
+
+
+class HandlerDispatchListener(QueueListener):
+    """Passes each record to the handlers its BoundedQueueHandler named."""
+
+    def handle(self, record: logging.LogRecord) -> None:
+        for handler in record.__dict__.pop("log_targets", ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def enqueue_sentinel(self) -> None:
+        # The queue may be full, wait for room rather than failing
+        self.queue.put(self._sentinel)
+
+
+_listener: HandlerDispatchListener | None = None
+
+
+def start_queue_logging(
+    logger_names: list[str], maxsize: int, drop_policy: str, correlation_id_filter
+) -> HandlerDispatchListener:
+    """Move the handlers of the given loggers behind one bounded queue."""
+    log_queue: queue.Queue = queue.Queue(maxsize)
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        queue_handler = BoundedQueueHandler(log_queue, logger.handlers, drop_policy)
+        queue_handler.addFilter(correlation_id_filter)
+        logger.handlers = [queue_handler]
+
+    listener = HandlerDispatchListener(log_queue)
+    listener.start()
+    return listener
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 # Define handlers based on environment
 handlers = ["default", "rotating_file"]
 if isinstance(config, DevConfig):
@@ -28,6 +216,19 @@ if isinstance(config, DevConfig):
 
 
 def configure_logging() -> None:
+    global _listener
+    stop_logging()
+
+    correlation_id = {
+        "uuid_length": 8 if isinstance(config, DevConfig) else 32,
+        "default_value": "-",
+    }
+    # In queue mode the correlation id is attached when the record is queued,
+    # the listener thread can't see the request's contextvar
+    handler_filters = ["email_obfuscation"]
+    if not config.LOG_QUEUE_ENABLED:
+        handler_filters.insert(0, "correlation_id")
+
     dictConfig(
         {
             "version": 1,
@@ -36,8 +237,7 @@ def configure_logging() -> None:
                 # Correlation ID filter for tracing logs across requests
                 "correlation_id": {
                     "()": "asgi_correlation_id.CorrelationIdFilter",
-                    "uuid_length": 8 if isinstance(config, DevConfig) else 32,
-                    "default_value": "-",
+                    **correlation_id,
                 },
                 "email_obfuscation": {
                     "()": EmailObfuscationFilter,
@@ -61,7 +261,7 @@ def configure_logging() -> None:
                     "class": "rich.logging.RichHandler",
                     "level": "DEBUG",
                     "formatter": "console",
-                    "filters": ["correlation_id", "email_obfuscation"],
+                    "filters": handler_filters,
                 },
                 "rotating_file": {
                     "class": "logging.handlers.RotatingFileHandler",
@@ -71,13 +271,13 @@ def configure_logging() -> None:
                     "maxBytes": 1024 * 1024,  # 1MB size before rotating
                     "backupCount": 5,  # Keep 5 backup files
                     "encoding": "utf8",
-                    "filters": ["correlation_id", "email_obfuscation"],
+                    "filters": handler_filters,
                 },
                 "logtail": {
                     "class": "logtail.LogtailHandler",
                     "level": "DEBUG",
                     "formatter": "console",
-                    "filters": ["correlation_id", "email_obfuscation"],
+                    "filters": handler_filters,
                     "source_token": config.LOGTAIL_API_KEY,
                 },
             },
@@ -91,6 +291,13 @@ def configure_logging() -> None:
                     "level": "DEBUG" if isinstance(config, DevConfig) else "INFO",
                     "propagate": False,
                 },
+                # SQL, parameters and timing of every query, see
+                # blogapi.database.instrumented
+                "blogapi.database.queries": {
+                    "level": "DEBUG"
+                    if isinstance(config, DevConfig) or config.LOG_QUERIES
+                    else "INFO",
+                },
                 "databases": {
                     "handlers": ["default"],
                     "level": "WARNING",
@@ -102,3 +309,12 @@ def configure_logging() -> None:
             },
         }
     )
+    configure_sampling(config.LOG_SAMPLE_RATES, config.LOG_RATE_LIMITS)
+
+    if config.LOG_QUEUE_ENABLED:
+        _listener = start_queue_logging(
+            ["uvicorn", "blogapi", "databases", "asyncpg"],
+            maxsize=config.LOG_QUEUE_SIZE,
+            drop_policy=config.LOG_QUEUE_DROP_POLICY,
+            correlation_id_filter=CorrelationIdFilter(**correlation_id),
+        )
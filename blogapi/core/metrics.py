@@ -0,0 +1,320 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from collections.abc import Callable, Iterable
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from blogapi.core.config import config
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, for request, query and upstream call latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count, like a Prometheus histogram."""
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class Metric:
+    """A named metric with one value per combination of label values.
+
+    Values are plain numbers and Histograms in a dict, updated without
+    locks. Each worker process only updates them from its event loop, and
+    workers are combined when scraped, see MetricsStore.
+    """
+
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: "MetricsRegistry | None" = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple[str, ...], float | Histogram] = {}
+        (registry or metrics_registry).register(self)
+
+    def samples(self) -> list:
+        return [
+            [list(labels), value.snapshot() if isinstance(value, Histogram) else value]
+            for labels, value in self.values.items()
+        ]
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class GaugeMetric(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        histogram = self.values.get(labels)
+        if histogram is None:
+            histogram = self.values[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> None:
+        self.metrics[metric.name] = metric
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        """Run `collect` before each snapshot, e.g. to set gauges from stats."""
+        self.collectors.append(collect)
+
+    def snapshot(self) -> dict:
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception:
+                logger.warning("Metrics collector failed", exc_info=True)
+
+        return {
+            name: {
+                "type": metric.kind,
+                "help": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "samples": metric.samples(),
+            }
+            for name, metric in self.metrics.items()
+        }
+
+
+def merge_snapshots(snapshots: Iterable[dict]) -> dict:
+    """Add up snapshots of several workers, label set by label set."""
+    merged: dict = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = value
+                elif isinstance(value, dict):
+                    target["samples"][key] = {
+                        "buckets": {
+                            bound: count + current["buckets"].get(bound, 0)
+                            for bound, count in value["buckets"].items()
+                        },
+                        "sum": current["sum"] + value["sum"],
+                        "count": current["count"] + value["count"],
+                    }
+                else:
+                    target["samples"][key] = current + value
+
+    for metric in merged.values():
+        metric["samples"] = [
+            [list(labels), value] for labels, value in metric["samples"].items()
+        ]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def render(snapshot: dict) -> str:
+    """Prometheus text exposition format, version 0.0.4."""
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labelnames"]
+        for labels, value in metric["samples"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {value}")
+                continue
+            for bound, count in value["buckets"].items():
+                le = "+Inf" if bound == "inf" else bound
+                bucket_labels = _labels((*names, "le"), (*labels, le))
+                lines.append(f"{name}_bucket{bucket_labels} {count}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {value['sum']}")
+            lines.append(f"{name}_count{_labels(names, labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsStore:
+    """Shares metrics between the worker processes of one server.
+
+    Each worker writes its snapshot to `<directory>/<pid>.json`, and a
+    scrape of any worker adds up the files of all workers. Files not
+    written for `stale_after` seconds belong to workers that are gone and
+    are left out.
+    """
+
+    def __init__(self, directory: str, stale_after: float) -> None:
+        self.directory = directory
+        self.stale_after = stale_after
+        self.path = os.path.join(directory, f"{os.getpid()}.json")
+
+    def write(self, snapshot: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(temporary, self.path)
+
+    def read_all(self) -> list[dict]:
+        snapshots = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                if now - entry.stat().st_mtime > self.stale_after:
+                    continue
+                with open(entry.path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed by its worker, or half written, since listing
+                continue
+        return snapshots
+
+    async def write_periodically(self, registry: "MetricsRegistry", interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.write, registry.snapshot())
+            except Exception:
+                logger.warning("Writing metrics failed", exc_info=True)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+metrics_registry = MetricsRegistry()
+# State all workers share, like the job queue in the database. Collected by
+# the worker that is scraped, as adding it up across workers would count it
+# once per worker.
+cluster_metrics_registry = MetricsRegistry()
+
+metrics_store = (
+    MetricsStore(config.METRICS_DIR, stale_after=3 * config.METRICS_WRITE_INTERVAL)
+    if config.METRICS_DIR
+    else None
+)
+
+http_requests = CounterMetric(
+    "blogapi_http_requests_total",
+    "HTTP requests handled, by route and status code.",
+    ("method", "route", "status"),
+)
+http_request_duration = HistogramMetric(
+    "blogapi_http_request_duration_seconds",
+    "Time to handle HTTP requests, by route.",
+    ("method", "route"),
+)
+http_requests_in_progress = GaugeMetric(
+    "blogapi_http_requests_in_progress",
+    "HTTP requests being handled.",
+    ("method",),
+)
+
+upstream_request_duration = HistogramMetric(
+    "blogapi_upstream_request_duration_seconds",
+    "Time of calls to external services, by service and status code.",
+    ("upstream", "status"),
+)
+task_duration = HistogramMetric(
+    "blogapi_task_duration_seconds",
+    "Time of background jobs and periodic tasks, by task and outcome.",
+    ("task", "outcome"),
+)
+
+
+class MetricsMiddleware:
+    """Counts and times HTTP requests per route.
+
+    Requests that match no route are recorded under "-", so probing random
+    paths can't create new label values.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "-")
+            http_request_duration.observe(time.perf_counter() - started, method, route)
+            http_requests.inc(method, route, str(status_code))
+            http_requests_in_progress.dec(method)
@@ -0,0 +1,95 @@
+from collections.abc import AsyncIterator
+from typing import Any
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.datastructures import Headers
+
+
+class MultipartError(Exception):
+    pass
+
+
+async def iter_multipart(
+    headers: Headers, stream: AsyncIterator[bytes]
+) -> AsyncIterator[tuple[str, Any]]:
+    """Parse a multipart/form-data body as it arrives, without buffering it.
+
+    Yields ("part", (name, filename)) when a part's headers are complete,
+    then ("data", bytes) for each piece of its content and ("end", None)
+    after it. Starlette's form parsing would instead store every file part
+    in a temporary file before the handler runs.
+    """
+    content_type, params = parse_options_header(headers.get("Content-Type"))
+    if content_type != b"multipart/form-data":
+        raise MultipartError("Expected a multipart/form-data body")
+    if b"boundary" not in params:
+        raise MultipartError("Missing boundary in multipart body")
+
+    events: list[tuple[str, Any]] = []
+    header_field = bytearray()
+    header_value = bytearray()
+    disposition = b""
+
+    def on_part_begin() -> None:
+        nonlocal disposition
+        disposition = b""
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header_value.extend(data[start:end])
+
+    def on_header_end() -> None:
+        nonlocal disposition
+        if header_field.lower() == b"content-disposition":
+            disposition = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished() -> None:
+        _, options = parse_options_header(disposition)
+        name = options.get(b"name")
+        filename = options.get(b"filename")
+        events.append(
+            (
+                "part",
+                (
+                    name.decode("utf-8", "replace") if name is not None else None,
+                    filename.decode("utf-8", "replace")
+                    if filename is not None
+                    else None,
+                ),
+            )
+        )
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        events.append(("data", data[start:end]))
+
+    def on_part_end() -> None:
+        events.append(("end", None))
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    async for chunk in stream:
+        try:
+            parser.write(chunk)
+        except MultipartParseError as e:
+            raise MultipartError(str(e)) from e
+        # Handed over after each network chunk, so the consumer's backpressure
+        # slows down reading the request
+        for event in events:
+            yield event
+        events.clear()
+    parser.finalize()
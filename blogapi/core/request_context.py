@@ -0,0 +1,36 @@
+from contextvars import ContextVar
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# ASGI scope of the request being handled, None outside requests
+request_scope: ContextVar[Scope | None] = ContextVar("request_scope", default=None)
+
+
+class RequestContextMiddleware:
+    """Makes the current request's scope available below the router.
+
+    The router fills in the matched route on the same scope, so code that
+    runs inside an endpoint, like the database layer, can tell which route
+    it is working for.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_scope.reset(token)
+
+
+def current_route() -> str:
+    """Path template of the matched route, e.g. /post/{post_id}, or "-"."""
+    scope = request_scope.get()
+    route = scope.get("route") if scope else None
+    return getattr(route, "path", "-")
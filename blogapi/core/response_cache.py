@@ -0,0 +1,286 @@
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, Protocol
+from urllib.parse import urlsplit
+
+from blogapi.core.cache import TTLCache
+from blogapi.core.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Any: ...
+
+    async def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+    async def incr(self, key: str) -> int: ...
+
+    async def counter(self, key: str) -> int: ...
+
+    async def aclose(self) -> None: ...
+
+
+class MemoryBackend:
+    """Entries in this worker process only, every worker keeps its own copy."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.entries = TTLCache(max_size, ttl)
+        self.counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> Any:
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        # TTLCache expires everything after the same ttl, given at creation
+        self.entries.set(key, value)
+
+    async def incr(self, key: str) -> int:
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+
+    async def counter(self, key: str) -> int:
+        return self.counters.get(key, 0)
+
+    async def aclose(self) -> None:
+        self.entries.clear()
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    """Entries shared by all workers in a server speaking the Redis protocol.
+
+    A deliberately small RESP client, it only needs GET, SET with PX and
+    INCR. Commands go over one connection, one at a time, and the connection
+    is reopened after an error.
+    """
+
+    def __init__(self, url: str, timeout: float = 1.0) -> None:
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.password = parts.password
+        self.timeout = timeout
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Any:
+        value = await self.execute("GET", key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.execute("SET", key, json.dumps(value), "PX", int(ttl * 1000))
+
+    async def incr(self, key: str) -> int:
+        return await self.execute("INCR", key)
+
+    async def counter(self, key: str) -> int:
+        value = await self.execute("GET", key)
+        return int(value) if value is not None else 0
+
+    async def execute(self, *args) -> Any:
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(self._execute(*args), self.timeout)
+            except (OSError, TimeoutError, asyncio.IncompleteReadError) as e:
+                await self._close()
+                raise RedisError(f"{args[0]} failed: {e!r}") from e
+
+    async def _execute(self, *args) -> Any:
+        if self._writer is None:
+            await self._connect()
+        self._writer.write(encode_command(*args))
+        await self._writer.drain()
+        return await read_reply(self._reader)
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            self._writer.write(encode_command("AUTH", self.password))
+            await read_reply(self._reader)
+        if self.db:
+            self._writer.write(encode_command("SELECT", self.db))
+            await read_reply(self._reader)
+
+    async def _close(self) -> None:
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def aclose(self) -> None:
+        async with self._lock:
+            await self._close()
+
+
+def encode_command(*args) -> bytes:
+    encoded = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in args]
+    return b"".join(
+        [f"*{len(encoded)}\r\n".encode()]
+        + [b"$%d\r\n%s\r\n" % (len(arg), arg) for arg in encoded]
+    )
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    match kind:
+        case b"+":
+            return rest.decode()
+        case b"-":
+            raise RedisError(rest.decode())
+        case b":":
+            return int(rest)
+        case b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            return (await reader.readexactly(length + 2))[:-2]
+        case b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply {line!r}")
+
+
+class StaleWhileRevalidateCache:
+    """Caches loaded values, serving stale ones while a refresh runs.
+
+    An entry is fresh for `ttl` seconds and until `invalidate()` bumps the
+    cache's generation. After that it is stale but still served for up to
+    `stale_ttl` seconds, while one background task per key and process
+    reloads it. Only a missing or too old entry makes the caller wait for
+    the load, and concurrent callers share that load. Backend errors are
+    logged and the value is loaded directly, so a cache outage never fails
+    a request.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        namespace: str,
+        ttl: float,
+        stale_ttl: float,
+        timer: Callable[[], float] = time.time,
+    ) -> None:
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timer = timer
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @property
+    def generation_key(self) -> str:
+        return f"{self.namespace}:generation"
+
+    async def get(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            generation = await self.backend.counter(self.generation_key)
+            entry = await self.backend.get(f"{self.namespace}:{key}")
+        except Exception:
+            logger.warning("Response cache read failed", exc_info=True)
+            self.errors += 1
+            return await load()
+
+        age = self.timer() - entry["stored_at"] if entry else None
+        if entry and entry["generation"] == generation and age < self.ttl:
+            self.hits += 1
+            return entry["value"]
+
+        if entry and self.stale_ttl and age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            if key not in self._inflight:
+                self._start_load(key, load, generation)
+            return entry["value"]
+
+        self.misses += 1
+        task = self._inflight.get(key) or self._start_load(key, load, generation)
+        return await asyncio.shield(task)
+
+    def _start_load(self, key: str, load, generation: int) -> asyncio.Task:
+        task = asyncio.create_task(self._load(key, load, generation))
+        self._inflight[key] = task
+        task.add_done_callback(lambda task: self._load_done(key, task))
+        return task
+
+    def _load_done(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # Callers waiting on a miss get the error themselves, this is for
+        # background refreshes that nobody awaits
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(
+                "Loading %s:%s failed: %r", self.namespace, key, task.exception()
+            )
+
+    async def _load(self, key: str, load, generation: int) -> Any:
+        # Stored with the generation read before loading, so an invalidation
+        # that lands during the load leaves the entry stale
+        value = await load()
+        entry = {"generation": generation, "stored_at": self.timer(), "value": value}
+        try:
+            await self.backend.set(
+                f"{self.namespace}:{key}", entry, self.ttl + self.stale_ttl
+            )
+        except Exception:
+            logger.warning("Response cache write failed", exc_info=True)
+            self.errors += 1
+        return value
+
+    async def invalidate(self) -> None:
+        try:
+            await self.backend.incr(self.generation_key)
+        except Exception:
+            logger.warning("Response cache invalidation failed", exc_info=True)
+            self.errors += 1
+
+    async def drain(self) -> None:
+        """Wait for background refreshes, e.g. on shutdown."""
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "refreshing": len(self._inflight),
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+
+def make_backend() -> CacheBackend:
+    if config.FEED_CACHE_REDIS_URL:
+        return RedisBackend(config.FEED_CACHE_REDIS_URL)
+    return MemoryBackend(
+        config.FEED_CACHE_MAX_ENTRIES,
+        ttl=config.FEED_CACHE_TTL + config.FEED_CACHE_STALE_TTL,
+    )
+
+
+# Pages of GET /post for anonymous callers, invalidated by anything that
+# changes what the feed shows
+feed_cache = StaleWhileRevalidateCache(
+    make_backend(),
+    namespace="feed",
+    ttl=config.FEED_CACHE_TTL,
+    stale_ttl=config.FEED_CACHE_STALE_TTL,
+)
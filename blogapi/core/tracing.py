@@ -0,0 +1,131 @@
+import time
+from collections.abc import Callable
+
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from blogapi.core.config import config
+
+
+class AdaptiveSampler:
+    """Sentry traces_sampler with per-route rates and a traces per second budget.
+
+    Each route is traced at its rate from `route_rates`, keyed by path
+    template like "/post/{post_id}", or at `default_rate`. Every `window`
+    seconds the sampler works out how many traces per second those rates
+    asked for. When that is over `target_per_second`, all rates are scaled
+    down by the same factor for the next window.
+
+    Sentry decides when a request starts, before anyone knows how it ends.
+    So after a route answers with a 5xx or takes `slow_threshold` seconds
+    or more, its requests are traced in full for `boost_for` seconds. Those
+    traces don't count against the budget. Error events are sent whether or
+    not the request is traced.
+    """
+
+    def __init__(
+        self,
+        default_rate: float,
+        route_rates: dict[str, float],
+        target_per_second: float,
+        slow_threshold: float,
+        boost_for: float,
+        window: float = 5.0,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.default_rate = default_rate
+        self.route_rates = route_rates
+        self.target_per_second = target_per_second
+        self.slow_threshold = slow_threshold
+        self.boost_for = boost_for
+        self.window = window
+        self.timer = timer
+        self.routes: list[BaseRoute] = []
+        self.factor = 1.0
+        self.boosted: dict[str, float] = {}
+        self._window_start = timer()
+        self._demand = 0.0
+
+    def route_for(self, scope: Scope) -> str:
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "-")
+        return "-"
+
+    def __call__(self, sampling_context: dict) -> float:
+        # Keep the decision of the service that called us, if it made one
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+
+        now = self.timer()
+        if now - self._window_start >= self.window:
+            self._new_window(now)
+
+        scope = sampling_context.get("asgi_scope")
+        route = self.route_for(scope) if scope else "-"
+        if self.boosted.get(route, 0) > now:
+            return 1.0
+
+        rate = self.route_rates.get(route, self.default_rate)
+        self._demand += rate
+        return rate * self.factor
+
+    def _new_window(self, now: float) -> None:
+        demand_per_second = self._demand / (now - self._window_start)
+        self.factor = (
+            min(1.0, self.target_per_second / demand_per_second)
+            if self.target_per_second and demand_per_second
+            else 1.0
+        )
+        self._window_start = now
+        self._demand = 0.0
+        self.boosted = {
+            route: until for route, until in self.boosted.items() if until > now
+        }
+
+    def record(self, route: str, duration: float, status_code: int) -> None:
+        """Note how a request ended, boosting its route if it failed or was slow."""
+        if status_code >= 500 or duration >= self.slow_threshold:
+            self.boosted[route] = self.timer() + self.boost_for
+
+    def stats(self) -> dict:
+        return {"factor": self.factor, "boosted": sorted(self.boosted)}
+
+
+traces_sampler = AdaptiveSampler(
+    default_rate=config.SENTRY_TRACES_SAMPLE_RATE,
+    route_rates=config.SENTRY_TRACES_ROUTE_RATES,
+    target_per_second=config.SENTRY_TRACES_PER_SECOND,
+    slow_threshold=config.SENTRY_SLOW_REQUEST_THRESHOLD,
+    boost_for=config.SENTRY_BOOST_SECONDS,
+)
+
+
+class SamplingFeedbackMiddleware:
+    """Reports each request's route, duration and status to the sampler."""
+
+    def __init__(self, app: ASGIApp, sampler: AdaptiveSampler) -> None:
+        self.app = app
+        self.sampler = sampler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "-")
+            self.sampler.record(route, time.perf_counter() - started, status_code)
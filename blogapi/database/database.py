@@ -1,12 +1,35 @@
-import databases
 import sqlalchemy
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, MetaData, String, Table
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    Sequence,
+    String,
+    Table,
+    UniqueConstraint,
+    func,
+)
 import os
 
 from blogapi.core.config import config
+from blogapi.core.metrics import metrics_registry
+from blogapi.database.instrumented import InstrumentedDatabase
+from blogapi.database.replica import ReplicaRouter
 
+# Schema changes also need an Alembic revision in blogapi/migrations/versions
 metadata = MetaData()
 
+# Every write that changes how a post is served (new comment, like, image)
+# gives it the next value, so ETags can be derived from versions and the
+# highest version changes whenever any post in the feed does
+post_version_seq = Sequence("post_version_seq", metadata=metadata)
+
 user_table = Table(
     "users",
     metadata,
@@ -23,6 +46,19 @@ post_table = Table(
     Column("body", String),
     Column("user_id", ForeignKey("users.id"), nullable=False),
     Column("image_url", String),
+    # Denormalized count of rows in likes, kept up to date by like_post and
+    # repaired by the reconcile_like_counts task if it ever drifts
+    Column("like_count", Integer, nullable=False, server_default="0"),
+    Column(
+        "version",
+        BigInteger,
+        nullable=False,
+        server_default=post_version_seq.next_value(),
+    ),
+    Index("ix_posts_version", "version"),
+    # Serves the most_likes feed in order, read backwards from the top, so a
+    # page costs the same however many posts there are
+    Index("ix_posts_like_count_id", "like_count", "id"),
 )
 
 comment_table = Table(
@@ -32,6 +68,7 @@ comment_table = Table(
     Column("body", String),
     Column("user_id", ForeignKey("users.id"), nullable=False),
     Column("post_id", ForeignKey("posts.id"), nullable=False),
+    Index("ix_comments_post_id_id", "post_id", "id"),
 )
 
 like_table = Table(
@@ -40,6 +77,41 @@ like_table = Table(
     Column("id", Integer, primary_key=True),
     Column("user_id", ForeignKey("users.id"), nullable=False),
     Column("post_id", ForeignKey("posts.id"), nullable=False),
+    UniqueConstraint("user_id", "post_id", name="uq_likes_user_id_post_id"),
+    Index("ix_likes_post_id", "post_id"),
+)
+
+# Content-addressed index of files stored in B2, so identical uploads are
+# only stored once
+upload_table = Table(
+    "uploads",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("sha256", String(64), unique=True, nullable=False),
+    Column("size", BigInteger, nullable=False),
+    Column("file_url", String, nullable=False),
+)
+
+# Durable background job queue, see blogapi/service_tasks/jobs.py
+job_table = Table(
+    "jobs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("type", String, nullable=False),
+    Column("payload", JSON, nullable=False),
+    # queued -> running -> deleted on success, or back to queued for a retry,
+    # or failed once the job type's max attempts are used up
+    Column("status", String, nullable=False, server_default="queued"),
+    Column("attempts", Integer, nullable=False, server_default="0"),
+    Column(
+        "run_at", DateTime(timezone=True), nullable=False, server_default=func.now()
+    ),
+    Column("locked_at", DateTime(timezone=True)),
+    Column("last_error", String),
+    Column(
+        "created_at", DateTime(timezone=True), nullable=False, server_default=func.now()
+    ),
+    Index("ix_jobs_type_status_run_at", "type", "status", "run_at"),
 )
 
 
@@ -54,8 +126,41 @@ if config.ENV_STATE in ("dev", "test"):
     metadata.drop_all(engine)
     metadata.create_all(engine)
 
-db_args = {"min_size": 1, "max_size": 4} if "postgres" in config.DATABASE_URL else {}
-database = databases.Database(
-    config.DATABASE_URL, force_rollback=config.DB_FORCE_ROLL_BACK, **db_args
+db_args = (
+    {
+        "min_size": config.DB_POOL_MIN_SIZE,
+        "max_size": config.DB_POOL_MAX_SIZE,
+        "acquire_timeout": config.DB_POOL_ACQUIRE_TIMEOUT,
+        "server_settings": {
+            "statement_timeout": str(int(config.DB_STATEMENT_TIMEOUT * 1000))
+        },
+    }
+    if "postgres" in config.DATABASE_URL
+    else {}
+)
+slow_query_args = {
+    "slow_query_threshold": config.SLOW_QUERY_THRESHOLD,
+    "explain_rate": config.SLOW_QUERY_EXPLAIN_RATE,
+}
+database = InstrumentedDatabase(
+    config.DATABASE_URL,
+    force_rollback=config.DB_FORCE_ROLL_BACK,
+    **db_args,
+    **slow_query_args,
 )
 
+replica_database = (
+    InstrumentedDatabase(config.REPLICA_DATABASE_URL, **db_args, **slow_query_args)
+    if config.REPLICA_DATABASE_URL
+    else None
+)
+metrics_registry.add_collector(lambda: database.collect_metrics("primary"))
+if replica_database is not None:
+    metrics_registry.add_collector(lambda: replica_database.collect_metrics("replica"))
+
+replica_router = ReplicaRouter(
+    database,
+    replica_database,
+    max_lag=config.REPLICA_MAX_LAG,
+    sticky_for=config.REPLICA_STICKY_SECONDS,
+)
@@ -0,0 +1,304 @@
+import logging
+import random
+import re
+import sys
+import time
+from collections import Counter
+from collections.abc import AsyncGenerator, Awaitable, Mapping
+from typing import Any
+
+import databases
+from asgi_correlation_id import correlation_id
+from databases.backends.postgres import PostgresBackend, PostgresConnection
+from sqlalchemy import text
+from sqlalchemy.sql import ClauseElement
+
+from blogapi.core.metrics import GaugeMetric, Histogram, HistogramMetric
+from blogapi.core.request_context import current_route
+
+logger = logging.getLogger(__name__)
+query_logger = logging.getLogger("blogapi.database.queries")
+slow_query_logger = logging.getLogger("blogapi.database.slow_queries")
+
+# Only plain reads are run again under EXPLAIN ANALYZE
+EXPLAINABLE_QUERY = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+WRITE_KEYWORDS = re.compile(r"\b(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+# Upper bounds in seconds of the connection acquire wait histogram
+ACQUIRE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Query = ClauseElement | str
+
+query_duration = HistogramMetric(
+    "blogapi_db_query_duration_seconds",
+    "Time to run database queries, by the function that ran them.",
+    ("call_site",),
+)
+pool_connections = GaugeMetric(
+    "blogapi_db_pool_connections",
+    "Database pool connections, in use, idle and callers waiting for one.",
+    ("database", "state"),
+)
+pool_acquire_wait = HistogramMetric(
+    "blogapi_db_pool_acquire_wait_seconds",
+    "Time waited for a database pool connection.",
+    ("database",),
+    buckets=ACQUIRE_WAIT_BUCKETS,
+)
+
+
+def call_site() -> str:
+    """Qualified name of the innermost blogapi function outside the database
+    package on the stack, e.g. blogapi.routers.post.get_all_posts, or "-".
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("blogapi.") and not module.startswith("blogapi.database."):
+            return f"{module}.{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return "-"
+
+
+class RenderedQuery:
+    """SQL and bound parameters of a query, compiled only when printed.
+
+    Passed as a logging argument so nothing is compiled for records that are
+    below the logger's level, sampled out or rate limited.
+    """
+
+    def __init__(self, query: Query, values: Mapping | None, dialect) -> None:
+        self.query = query
+        self.values = values
+        self.dialect = dialect
+
+    def __str__(self) -> str:
+        query = text(self.query) if isinstance(self.query, str) else self.query
+        compiled = query.compile(dialect=self.dialect)
+        params = {**compiled.params, **(self.values or {})}
+        return f"{compiled} params={params}" if params else str(compiled)
+
+
+class PoolTimeoutError(TimeoutError):
+    """No pool connection became free within the acquire timeout.
+
+    Answered with a 503 by the app, see main.py.
+    """
+
+
+class PoolMetrics:
+    def __init__(self) -> None:
+        self.acquire_wait = Histogram(ACQUIRE_WAIT_BUCKETS)
+        self.waiting = 0
+        self.timeouts: Counter[str] = Counter()
+
+
+class InstrumentedPostgresConnection(PostgresConnection):
+    _database: "InstrumentedPostgresBackend"
+
+    async def acquire(self) -> None:
+        assert self._connection is None, "Connection is already acquired"
+        assert self._database._pool is not None, "DatabaseBackend is not running"
+
+        metrics = self._database.metrics
+        metrics.waiting += 1
+        started = time.perf_counter()
+        try:
+            self._connection = await self._database._pool.acquire(
+                timeout=self._database.acquire_timeout
+            )
+        except TimeoutError as e:
+            route = current_route()
+            metrics.timeouts[route] += 1
+            logger.warning("Timed out waiting for a database connection on %s", route)
+            raise PoolTimeoutError(
+                f"No database connection free within {self._database.acquire_timeout}s"
+            ) from e
+        finally:
+            metrics.waiting -= 1
+            metrics.acquire_wait.observe(time.perf_counter() - started)
+
+
+class InstrumentedPostgresBackend(PostgresBackend):
+    def __init__(self, *args, acquire_timeout: float | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.acquire_timeout = acquire_timeout
+        self.metrics = PoolMetrics()
+
+    def connection(self) -> InstrumentedPostgresConnection:
+        return InstrumentedPostgresConnection(self, self._dialect)
+
+
+class InstrumentedDatabase(databases.Database):
+    """Database that times every query and logs it to blogapi.database.queries.
+
+    Queries are logged at DEBUG with their duration, SQL and parameters.
+    Anything that goes through `database` is covered, including queries run
+    inside `database.transaction()`.
+
+    Queries taking `slow_query_threshold` seconds or more are also logged
+    at WARNING to blogapi.database.slow_queries, with their call site and
+    the request's correlation id. A share `explain_rate` of slow reads is
+    run again under EXPLAIN ANALYZE, in a transaction that is rolled back,
+    and the plan is added to the log.
+
+    On Postgres it also tracks the connection pool. It records how long
+    callers wait for a connection and gives up after `acquire_timeout`
+    seconds with PoolTimeoutError, counting the timeout against the current
+    route.
+    """
+
+    def __init__(
+        self,
+        url,
+        *,
+        acquire_timeout: float | None = None,
+        slow_query_threshold: float | None = None,
+        explain_rate: float = 0.0,
+        **options,
+    ) -> None:
+        super().__init__(url, **options)
+        self.slow_query_threshold = slow_query_threshold
+        self.explain_rate = explain_rate
+        self.random = random.random
+        if isinstance(self._backend, PostgresBackend):
+            self._backend = InstrumentedPostgresBackend(
+                self.url, acquire_timeout=acquire_timeout, **self.options
+            )
+
+    def pool_stats(self) -> dict:
+        """Connections in use and idle, acquire waits and timeouts per route."""
+        if not isinstance(self._backend, InstrumentedPostgresBackend):
+            return {}
+
+        pool = self._backend._pool
+        size = pool.get_size() if pool else 0
+        idle = pool.get_idle_size() if pool else 0
+        metrics = self._backend.metrics
+        return {
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "max_size": pool.get_max_size() if pool else 0,
+            "waiting": metrics.waiting,
+            "acquire_wait": metrics.acquire_wait.snapshot(),
+            "timeouts": dict(metrics.timeouts),
+        }
+
+    def collect_metrics(self, name: str) -> None:
+        """Copy pool state into the metrics, run before each snapshot."""
+        if not isinstance(self._backend, InstrumentedPostgresBackend):
+            return
+
+        stats = self.pool_stats()
+        for state in ("in_use", "idle", "waiting"):
+            pool_connections.set(stats[state], name, state)
+        pool_acquire_wait.values[(name,)] = self._backend.metrics.acquire_wait
+
+    async def execute(self, query: Query, values: dict | None = None) -> Any:
+        return await self._timed(super().execute(query, values), query, values)
+
+    async def execute_many(self, query: Query, values: list) -> None:
+        return await self._timed(super().execute_many(query, values), query, None)
+
+    async def fetch_all(self, query: Query, values: dict | None = None) -> list:
+        return await self._timed(super().fetch_all(query, values), query, values)
+
+    async def fetch_one(self, query: Query, values: dict | None = None):
+        return await self._timed(super().fetch_one(query, values), query, values)
+
+    async def fetch_val(
+        self, query: Query, values: dict | None = None, column: Any = 0
+    ) -> Any:
+        return await self._timed(
+            super().fetch_val(query, values, column=column), query, values
+        )
+
+    async def iterate(
+        self, query: Query, values: dict | None = None
+    ) -> AsyncGenerator[Mapping, None]:
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            async for record in super().iterate(query, values):
+                yield record
+            succeeded = True
+        finally:
+            await self._record_query(query, values, started, succeeded)
+
+    async def _timed(self, operation: Awaitable, query: Query, values: dict | None):
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            result = await operation
+            succeeded = True
+            return result
+        finally:
+            await self._record_query(query, values, started, succeeded)
+
+    async def _record_query(
+        self, query: Query, values: dict | None, started: float, succeeded: bool
+    ) -> None:
+        elapsed = time.perf_counter() - started
+        site = call_site()
+        query_duration.observe(elapsed, site)
+
+        if (
+            self.slow_query_threshold is not None
+            and elapsed >= self.slow_query_threshold
+        ):
+            await self._log_slow_query(query, values, elapsed, site, succeeded)
+        elif query_logger.isEnabledFor(logging.DEBUG):
+            query_logger.debug(
+                "Query took %.2fms: %s",
+                elapsed * 1000,
+                RenderedQuery(query, values, self._backend._dialect),
+                extra={"duration_ms": elapsed * 1000},
+            )
+
+    async def _log_slow_query(
+        self,
+        query: Query,
+        values: dict | None,
+        elapsed: float,
+        site: str,
+        succeeded: bool,
+    ) -> None:
+        rendered = RenderedQuery(query, values, self._backend._dialect)
+        plan = None
+        # A failed query may have hit the statement timeout, or left the
+        # transaction unusable, don't run it again
+        if succeeded and self.explain_rate and self.random() < self.explain_rate:
+            plan = await self.explain(query, values)
+
+        slow_query_logger.warning(
+            "Slow query took %.2fms in %s, request %s: %s%s",
+            elapsed * 1000,
+            site,
+            correlation_id.get() or "-",
+            rendered,
+            f"\n{plan}" if plan else "",
+            extra={"duration_ms": elapsed * 1000, "call_site": site},
+        )
+
+    async def explain(self, query: Query, values: dict | None = None) -> str | None:
+        """EXPLAIN ANALYZE output for a read query, None if it can't be had."""
+        if not isinstance(self._backend, PostgresBackend):
+            return None
+
+        try:
+            async with self.connection() as connection:
+                sql, args, _ = connection._connection._compile(
+                    connection._build_query(query, values)
+                )
+                if not EXPLAINABLE_QUERY.match(sql) or WRITE_KEYWORDS.search(sql):
+                    return None
+                # ANALYZE runs the query, never let it change anything
+                async with connection.transaction(force_rollback=True):
+                    rows = await connection.raw_connection.fetch(
+                        f"EXPLAIN (ANALYZE, BUFFERS) {sql}", *args
+                    )
+        except Exception:
+            logger.warning("Explaining slow query failed", exc_info=True)
+            return None
+        return "\n".join(row[0] for row in rows)
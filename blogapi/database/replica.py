@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from collections.abc import Callable
+from typing import Any
+
+import asyncpg
+from databases import Database
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from blogapi.database.instrumented import PoolTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Cookie holding the Unix time until which a client that wrote reads from
+# the primary
+PRIMARY_UNTIL_COOKIE = "blogapi_primary_until"
+
+# Errors that mean the replica itself is unreachable, the read is retried on
+# the primary. PoolTimeoutError is a TimeoutError, but only means the
+# replica is busy, see ReplicaRouter._read.
+REPLICA_ERRORS = (
+    OSError,
+    TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.CannotConnectNowError,
+)
+
+# Seconds the standby is behind, 0 when it has replayed everything it
+# received (an idle primary has no new transactions to replay)
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery()
+        OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+    )
+END
+"""
+
+
+class ReplicaRouter:
+    """Sends safe reads to a read replica, falling back to the primary.
+
+    Reads go to the primary when:
+    - there is no replica, or it is down;
+    - the replica is more than `max_lag` seconds behind;
+    - the client wrote something in the last `sticky_for` seconds, so
+      clients always read their own writes.
+
+    The time of a client's last write travels with the client, in the
+    PRIMARY_UNTIL_COOKIE cookie set by ReadYourWritesMiddleware, so it holds
+    whichever worker or server the next read lands on. Clients that don't
+    keep cookies can read from the replica right after a write.
+
+    `for_read` returns either the primary database or the router itself,
+    which runs reads on the replica and retries them on the primary when the
+    replica can't be reached.
+    """
+
+    def __init__(
+        self,
+        primary: Database,
+        replica: Database | None,
+        max_lag: float,
+        sticky_for: float,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.sticky_for = sticky_for
+        self.clock = clock
+        self.healthy = False
+        self.lag: float | None = None
+        self.reads: Counter[str] = Counter()
+
+    def for_read(self, primary_until: str | None = None) -> "Database | ReplicaRouter":
+        """Where to read, given the client's PRIMARY_UNTIL_COOKIE if it sent one."""
+        if self.replica is None:
+            return self.primary
+        if not self.healthy:
+            self.reads["primary_unhealthy"] += 1
+            return self.primary
+        if primary_until is not None and self.is_sticky(primary_until):
+            self.reads["primary_sticky"] += 1
+            return self.primary
+        return self
+
+    def is_sticky(self, primary_until: str) -> bool:
+        try:
+            until = float(primary_until)
+        except ValueError:
+            return False
+        now = self.clock()
+        # Later than any cookie we set means it was made up, ignored so that
+        # clients can't keep their reads on the primary
+        return now < until <= now + self.sticky_for
+
+    def sticky_cookie(self) -> str:
+        """Set-Cookie value keeping the client on the primary for `sticky_for`."""
+        until = self.clock() + self.sticky_for
+        return (
+            f"{PRIMARY_UNTIL_COOKIE}={until:.3f}; Max-Age={int(self.sticky_for) + 1}; "
+            "Path=/; HttpOnly; SameSite=Lax"
+        )
+
+    async def connect(self) -> None:
+        if self.replica is not None:
+            await self.check()
+
+    async def disconnect(self) -> None:
+        if self.replica is not None and self.replica.is_connected:
+            await self.replica.disconnect()
+
+    async def replica_lag(self) -> float:
+        if self.replica.url.dialect != "postgresql":
+            return 0.0
+        return float(await self.replica.fetch_val(REPLICA_LAG_QUERY))
+
+    async def check(self) -> bool:
+        """Connect to the replica if needed and see whether it is caught up."""
+        try:
+            if not self.replica.is_connected:
+                await self.replica.connect()
+            self.lag = await self.replica_lag()
+        except REPLICA_ERRORS:
+            logger.warning("Read replica is unreachable", exc_info=True)
+            self.lag = None
+            self.healthy = False
+            return False
+
+        healthy = self.lag <= self.max_lag
+        if healthy != self.healthy:
+            logger.warning(
+                "Read replica %s, %.1fs behind",
+                "back in use" if healthy else "lagging",
+                self.lag,
+            )
+        self.healthy = healthy
+        return healthy
+
+    async def monitor(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Read replica check failed")
+                self.healthy = False
+
+    async def _read(self, method: str, *args, **kwargs) -> Any:
+        try:
+            result = await getattr(self.replica, method)(*args, **kwargs)
+        except PoolTimeoutError:
+            # Busy rather than down, so it stays in use for other reads
+            logger.warning("Read replica pool is exhausted, reading from primary")
+            self.reads["primary_busy"] += 1
+            return await getattr(self.primary, method)(*args, **kwargs)
+        except REPLICA_ERRORS:
+            logger.warning("Read replica failed, reading from primary", exc_info=True)
+            self.healthy = False
+            self.reads["primary_fallback"] += 1
+            return await getattr(self.primary, method)(*args, **kwargs)
+
+        self.reads["replica"] += 1
+        return result
+
+    async def fetch_all(self, query, values: dict | None = None) -> list:
+        return await self._read("fetch_all", query, values)
+
+    async def fetch_one(self, query, values: dict | None = None):
+        return await self._read("fetch_one", query, values)
+
+    async def fetch_val(self, query, values: dict | None = None, column: Any = 0):
+        return await self._read("fetch_val", query, values, column=column)
+
+    def stats(self) -> dict:
+        return {"healthy": self.healthy, "lag": self.lag, "reads": dict(self.reads)}
+
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReadYourWritesMiddleware:
+    """Sets the sticky cookie on successful writes, see ReplicaRouter."""
+
+    def __init__(self, app: ASGIApp, router: ReplicaRouter) -> None:
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        if self.router.replica is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(scope=message)
+                headers.append("set-cookie", self.router.sticky_cookie())
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
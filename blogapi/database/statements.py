@@ -0,0 +1,99 @@
+from sqlalchemy.engine.interfaces import Dialect
+from sqlalchemy.sql import ClauseElement, visitors
+from sqlalchemy.sql.compiler import Compiled
+from sqlalchemy.sql.elements import BindParameter
+
+# Every cached statement by name, for stats
+registry: dict[str, "CachedStatement"] = {}
+
+
+class CachedStatement:
+    """A statement compiled once per dialect and reused with new parameters.
+
+    Build hot queries once with `bindparam()` placeholders and run them
+    with `database.fetch_one(statement.bind(post_id=post_id))`. `databases`
+    then skips building and compiling the SQLAlchemy expression on every
+    call. The SQL text stays the same between calls, so asyncpg also reuses
+    its prepared statement for it on each connection.
+    """
+
+    def __init__(self, name: str, statement: ClauseElement) -> None:
+        if any(
+            isinstance(element, BindParameter) and element.expanding
+            for element in visitors.iterate(statement)
+        ):
+            # IN lists render one placeholder per value, the SQL changes
+            # with the number of values
+            raise ValueError(f"Statement {name!r} has an expanding IN parameter")
+
+        self.name = name
+        self.statement = statement
+        self.compiles = 0
+        self.hits = 0
+        self._compiled: dict[tuple, tuple[Compiled, dict, set[str]]] = {}
+        registry[name] = self
+
+    def bind(self, **values) -> "BoundStatement":
+        return BoundStatement(self, values)
+
+    def compiled(self, dialect: Dialect, compile_kwargs: dict | None = None):
+        compile_kwargs = compile_kwargs or {}
+        key = (type(dialect), dialect.paramstyle, tuple(sorted(compile_kwargs.items())))
+        cached = self._compiled.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        compiled = self.statement.compile(
+            dialect=dialect, compile_kwargs=compile_kwargs
+        )
+        required = {name for bind, name in compiled.bind_names.items() if bind.required}
+        cached = self._compiled[key] = (compiled, compiled.params, required)
+        self.compiles += 1
+        return cached
+
+
+class BoundStatement:
+    """A CachedStatement with parameter values, ready to pass to `database`."""
+
+    def __init__(self, statement: CachedStatement, values: dict) -> None:
+        self.statement = statement
+        self.values = values
+
+    def compile(self, dialect: Dialect, compile_kwargs: dict | None = None, **kw):
+        compiled, defaults, required = self.statement.compiled(dialect, compile_kwargs)
+        if unknown := self.values.keys() - defaults.keys():
+            raise ValueError(f"Unknown parameters {sorted(unknown)}")
+        if missing := required - self.values.keys():
+            raise ValueError(f"Missing parameters {sorted(missing)}")
+        return BoundCompiled(compiled, {**defaults, **self.values})
+
+    def __str__(self) -> str:
+        return str(self.statement.statement)
+
+
+class BoundCompiled:
+    """A Compiled with this call's params, for `databases` to run.
+
+    `databases` reads SQLAlchemy internals of the Compiled, such as
+    `_bind_processors` and `_result_columns`, which are passed through
+    as is. SQLAlchemy is pinned to a minor version in requirements.txt
+    for that, and test_statements checks they are still there.
+    """
+
+    def __init__(self, compiled: Compiled, params: dict) -> None:
+        self.compiled = compiled
+        self.params = params
+
+    def __getattr__(self, name: str):
+        return getattr(self.compiled, name)
+
+    def __str__(self) -> str:
+        return self.compiled.string
+
+
+def stats() -> dict[str, dict[str, int]]:
+    return {
+        name: {"compiles": statement.compiles, "hits": statement.hits}
+        for name, statement in registry.items()
+    }
@@ -1,18 +1,127 @@
+import hashlib
 import logging
+import os
+import time
+import uuid
 from functools import lru_cache
+from typing import BinaryIO
 
+import anyio
+import anyio.from_thread
 import b2sdk.v2 as b2
+from databases import Database
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.dialects import postgresql
 
 from blogapi.core.config import config
+from blogapi.core.metrics import upstream_request_duration
+from blogapi.database.database import upload_table
 
 logger = logging.getLogger(__name__)
 
 
+class UploadTooLargeError(Exception):
+    pass
+
+
+class UploadIncompleteError(Exception):
+    pass
+
+
+class SizeLimitedReader:
+    """File-like wrapper that fails the upload once `max_size` bytes are read."""
+
+    def __init__(self, fileobj: BinaryIO, max_size: int) -> None:
+        self.fileobj = fileobj
+        self.max_size = max_size
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.fileobj.read(size)
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.max_size:
+            raise UploadTooLargeError(
+                f"Upload is larger than the limit of {self.max_size} bytes"
+            )
+        return chunk
+
+
+class ChunkReader:
+    """Blocking file-like reader over chunks sent from the event loop.
+
+    The event loop awaits `send()` for each chunk of a request body while a
+    worker thread started with run_in_threadpool reads, so the body goes
+    from the network to B2 without being stored. At most `max_chunks` are
+    held in between, after that `send()` waits for the reader.
+
+    Reading ends with `finish()`. If the sender stops with `abort()`
+    instead, e.g. because the client went away, reads fail with
+    UploadIncompleteError rather than ending a truncated file.
+    """
+
+    def __init__(self, max_chunks: int = 16) -> None:
+        self._send, self._receive = anyio.create_memory_object_stream[bytes](max_chunks)
+        self._buffer = bytearray()
+        self._complete = False
+
+    async def send(self, chunk: bytes) -> bool:
+        """Hand over a chunk, False once the reader has stopped reading."""
+        try:
+            await self._send.send(chunk)
+        except anyio.BrokenResourceError:
+            return False
+        return True
+
+    def finish(self) -> None:
+        self._complete = True
+        self._send.close()
+
+    def abort(self) -> None:
+        self._send.close()
+
+    def close(self) -> None:
+        """Stop reading, pending and later `send()` calls return False."""
+        self._receive.close()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += anyio.from_thread.run(self._receive.receive)
+            except anyio.EndOfStream:
+                if not self._complete:
+                    raise UploadIncompleteError("Upload ended early") from None
+                break
+
+        if size < 0:
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+
+class HashingReader:
+    """File-like wrapper computing the SHA-256 and size of what is read."""
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.fileobj.read(size)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self.digest.hexdigest()
+
+
 @lru_cache
 def b2_api():
     logger.debug("Creating and authorizing B2 API")
     info = b2.InMemoryAccountInfo()
-    b2_api = b2.B2Api(info)
+    b2_api = b2.B2Api(info, max_upload_workers=config.B2_UPLOAD_WORKERS)
 
     b2_api.authorize_account("production", config.B2_KEY_ID, config.B2_APPLICATION_KEY)
     return b2_api
@@ -23,17 +132,80 @@ def b2_get_bucket(api: b2.B2Api):
     return api.get_bucket_by_name(config.B2_BUCKET_NAME)
 
 
-@lru_cache
-def b2_upload_file(local_file: str, file_name: str) -> str:
+# Blocking, call it from a worker thread
+def b2_upload_stream(fileobj: BinaryIO, file_name: str) -> tuple[str, str]:
+    """Stream a file object to B2, returning the file's id and download URL.
+
+    The file object is read sequentially. Anything larger than one buffer is
+    sent as a B2 large file, with its parts uploaded in parallel by the B2
+    API's upload workers while the next buffer is being read.
+    """
     api = b2_api()
-    logger.debug(f"Uploading {local_file} to B2 as {file_name}")
+    logger.debug("Streaming upload of %s to B2", file_name)
 
-    uploaded_file = b2_get_bucket(api).upload_local_file(
-        local_file=local_file, file_name=file_name
+    uploaded_file = b2_get_bucket(api).upload_unbound_stream(
+        fileobj, file_name, buffers_count=config.B2_UPLOAD_BUFFERS
     )
     download_url = api.get_download_url_for_fileid(uploaded_file.id_)
     logger.debug(
-        f"Uploaded {local_file} to B2 successfully and got download URL {download_url}"
+        "Uploaded %s to B2 successfully and got download URL %s",
+        file_name,
+        download_url,
     )
 
-    return download_url
+    return uploaded_file.id_, download_url
+
+
+# Blocking, call it from a worker thread
+def b2_delete_file(file_id: str, file_name: str) -> None:
+    b2_api().delete_file_version(file_id, file_name)
+
+
+async def b2_upload_deduplicated(
+    database: Database, fileobj: BinaryIO, file_name: str | None
+) -> str:
+    """Upload a file object to B2, keeping a single copy of each content.
+
+    The file is read once, sequentially, so it can come straight from the
+    request. Its SHA-256 is only known once it has all been sent, so it is
+    stored under a random name. When the same content was uploaded before,
+    the new copy is deleted again and the stored URL returned.
+    """
+    reader = HashingReader(fileobj)
+    # Clients don't have to send a filename, stored without extension then
+    extension = os.path.splitext(file_name or "")[1].lower()
+    object_name = f"{uuid.uuid4().hex}{extension}"
+    # Timed here rather than in the worker thread, metrics are only updated
+    # from the event loop
+    started = time.perf_counter()
+    status = "error"
+    try:
+        file_id, file_url = await run_in_threadpool(
+            b2_upload_stream, reader, object_name
+        )
+        status = "200"
+    finally:
+        upstream_request_duration.observe(time.perf_counter() - started, "b2", status)
+
+    sha256 = reader.hexdigest()
+    # A concurrent upload of the same content may have won the race, the
+    # first URL recorded is kept either way
+    query = (
+        postgresql.insert(upload_table)
+        .values(sha256=sha256, size=reader.size, file_url=file_url)
+        .on_conflict_do_nothing(index_elements=["sha256"])
+        .returning(upload_table.c.file_url)
+    )
+    if await database.fetch_one(query):
+        return file_url
+
+    logger.debug("Upload of %s matches stored file %s", file_name, sha256)
+    try:
+        await run_in_threadpool(b2_delete_file, file_id, object_name)
+    except Exception:
+        logger.warning(
+            "Deleting duplicate upload %s failed", object_name, exc_info=True
+        )
+
+    query = upload_table.select().where(upload_table.c.sha256 == sha256)
+    return (await database.fetch_one(query))["file_url"]
@@ -1,27 +1,40 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
 import sentry_sdk
 from asgi_correlation_id import CorrelationIdMiddleware
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, status
 from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import JSONResponse
 
 from blogapi.core.config import config
-from blogapi.core.logging_conf import configure_logging
-from blogapi.database.database import database
+from blogapi.core.http_clients import http_clients
+from blogapi.core.logging_conf import configure_logging, stop_logging
+from blogapi.core.metrics import MetricsMiddleware, metrics_registry, metrics_store
+from blogapi.core.request_context import RequestContextMiddleware
+from blogapi.core.response_cache import feed_cache
+from blogapi.core.security import password_hash_pool
+from blogapi.core.tracing import SamplingFeedbackMiddleware, traces_sampler
+from blogapi.database.database import database, replica_router
+from blogapi.database.instrumented import PoolTimeoutError
+from blogapi.database.replica import ReadYourWritesMiddleware
+from blogapi.routers.metrics import router as metrics_router
+from blogapi.routers.post import like_buffer
 from blogapi.routers.post import router as post_router
 from blogapi.routers.upload import router as upload_router
 from blogapi.routers.user import router as user_router
+from blogapi.service_tasks.jobs import JobWorker
+from blogapi.service_tasks.tasks import (
+    email_outbox,
+    reconcile_like_counts_periodically,
+)
 
 sentry_sdk.init(
     dsn=config.SENTRY_DSN,
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for tracing.
-    traces_sample_rate=1.0,
-    # Set profiles_sample_rate to 1.0 to profile 100%
-    # of sampled transactions.
-    # We recommend adjusting this value in production.
-    profiles_sample_rate=1.0,
+    traces_sampler=traces_sampler,
+    # Relative to traced requests, so follows the sampler's rates
+    profiles_sample_rate=config.SENTRY_PROFILES_SAMPLE_RATE,
 )
 
 logger = logging.getLogger(__name__)
@@ -31,19 +44,88 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     configure_logging()
     await database.connect()
+    http_clients.open()
+    await replica_router.connect()
+
+    reconcile_task = None
+    if config.LIKE_COUNT_RECONCILE_INTERVAL > 0:
+        reconcile_task = asyncio.create_task(
+            reconcile_like_counts_periodically(
+                database, config.LIKE_COUNT_RECONCILE_INTERVAL
+            )
+        )
+
+    replica_task = None
+    if replica_router.replica is not None:
+        replica_task = asyncio.create_task(
+            replica_router.monitor(config.REPLICA_CHECK_INTERVAL)
+        )
+
+    metrics_task = None
+    if metrics_store is not None:
+        metrics_task = asyncio.create_task(
+            metrics_store.write_periodically(
+                metrics_registry, config.METRICS_WRITE_INTERVAL
+            )
+        )
+
+    worker = JobWorker(database)
+    worker_task = None
+    if config.JOB_WORKER_IN_PROCESS:
+        worker_task = asyncio.create_task(worker.run())
+
     yield
+
+    if worker_task:
+        worker.stop()
+        await worker_task
+    if reconcile_task:
+        reconcile_task.cancel()
+    if replica_task:
+        replica_task.cancel()
+    if metrics_task:
+        metrics_task.cancel()
+        metrics_store.remove()
+    await like_buffer.flush()
+    await email_outbox.flush()
+    await feed_cache.drain()
+    await feed_cache.backend.aclose()
+    await http_clients.aclose()
+    await replica_router.disconnect()
     await database.disconnect()
+    password_hash_pool.shutdown()
+    stop_logging()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(SamplingFeedbackMiddleware, sampler=traces_sampler)
 app.add_middleware(CorrelationIdMiddleware)
+app.add_middleware(RequestContextMiddleware)
+app.add_middleware(ReadYourWritesMiddleware, router=replica_router)
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router)
 
 app.include_router(post_router)
 app.include_router(upload_router)
 app.include_router(user_router)
+# Sentry samples before routing, so the sampler matches routes itself
+traces_sampler.routes = [
+    route
+    for router in (post_router, upload_router, user_router)
+    for route in router.routes
+]
 
 
 @app.exception_handler(HTTPException)
 async def http_exception_handle_logging(request, exc):
-    logger.error(f"HTTPException: {exc.status_code} {exc.detail}")
+    logger.error("HTTPException: %s %s", exc.status_code, exc.detail)
     return await http_exception_handler(request, exc)
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please try again later"},
+    )
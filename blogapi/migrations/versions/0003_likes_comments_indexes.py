@@ -0,0 +1,47 @@
+"""index likes and comments, make likes unique per user and post
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+revision: str = "0003"
+down_revision: str | Sequence[str] | None = "0002"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # Drop duplicate likes, keeping the oldest one, and fix the like counts
+    # they inflated before the unique constraint can be created
+    op.execute(
+        """
+        DELETE FROM likes
+        WHERE id NOT IN (SELECT min(id) FROM likes GROUP BY user_id, post_id)
+        """
+    )
+    op.execute(
+        """
+        UPDATE posts SET like_count = (
+            SELECT count(*) FROM likes WHERE likes.post_id = posts.id
+        )
+        """
+    )
+
+    # The unique index leads with user_id, so it also serves lookups by user
+    op.create_unique_constraint(
+        "uq_likes_user_id_post_id", "likes", ["user_id", "post_id"]
+    )
+    op.create_index("ix_likes_post_id", "likes", ["post_id"])
+    op.create_index("ix_comments_post_id_id", "comments", ["post_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_comments_post_id_id", table_name="comments")
+    op.drop_index("ix_likes_post_id", table_name="likes")
+    op.drop_constraint("uq_likes_user_id_post_id", "likes", type_="unique")
@@ -0,0 +1,38 @@
+"""add post version for ETags
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0006"
+down_revision: str | Sequence[str] | None = "0005"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("post_version_seq")))
+    # Existing posts each get their own version from the default
+    op.add_column(
+        "posts",
+        sa.Column(
+            "version",
+            sa.BigInteger(),
+            nullable=False,
+            server_default=sa.text("nextval('post_version_seq')"),
+        ),
+    )
+    op.create_index("ix_posts_version", "posts", ["version"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_posts_version", table_name="posts")
+    op.drop_column("posts", "version")
+    op.execute(sa.schema.DropSequence(sa.Sequence("post_version_seq")))
@@ -0,0 +1,24 @@
+"""index posts by like count for the most liked feed
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+revision: str = "0007"
+down_revision: str | Sequence[str] | None = "0006"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_posts_like_count_id", "posts", ["like_count", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_posts_like_count_id", table_name="posts")
@@ -19,6 +19,17 @@ class UserPostWithLikes(UserPost):
     likes: int
 
 
+class UserPostPage(BaseModel):
+    items: list[UserPostWithLikes]
+    next_cursor: str | None = None
+
+
+class UserPostBatch(BaseModel):
+    # In the order requested, ids with no post are listed in missing
+    items: list[UserPostWithLikes]
+    missing: list[int]
+
+
 class CommentIn(BaseModel):
     body: str
     post_id: int
@@ -31,9 +42,24 @@ class Comment(CommentIn):
     user_id: int
 
 
+class CommentResult(BaseModel):
+    """Outcome of one comment in a bulk request, in the order sent."""
+
+    status: int
+    comment: Comment | None = None
+    detail: str | None = None
+
+
+class CommentPage(BaseModel):
+    items: list[Comment]
+    next_cursor: str | None = None
+
+
 class UserPostWithComments(BaseModel):
     post: UserPostWithLikes
     comments: list[Comment]
+    # Cursor for /post/{post_id}/comment to continue after the embedded comments
+    next_comment_cursor: str | None = None
 
 
 class PostLikeIn(BaseModel):
@@ -41,5 +67,14 @@ class PostLikeIn(BaseModel):
 
 
 class PostLike(PostLikeIn):
-    id: int
+    # None when the like was accepted for a later write, see LIKE_WRITE_BEHIND
+    id: int | None
     user_id: int
+
+
+class PostLikeResult(BaseModel):
+    """Outcome of one like in a bulk request, in the order sent."""
+
+    status: int
+    like: PostLike | None = None
+    detail: str | None = None
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from blogapi.core.metrics import (
+    cluster_metrics_registry,
+    merge_snapshots,
+    metrics_registry,
+    metrics_store,
+    render,
+)
+from blogapi.database.database import database
+from blogapi.service_tasks.jobs import collect_queue_depth
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    snapshot = metrics_registry.snapshot()
+    if metrics_store is not None:
+        # Write this worker's metrics first, so the scrape includes them as
+        # of now, then add up every worker's
+        await asyncio.to_thread(metrics_store.write, snapshot)
+        snapshot = merge_snapshots(await asyncio.to_thread(metrics_store.read_all))
+
+    try:
+        await collect_queue_depth(database)
+    except Exception:
+        logger.warning("Collecting job queue depth failed", exc_info=True)
+    snapshot.update(cluster_metrics_registry.snapshot())
+    return PlainTextResponse(render(snapshot), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -3,42 +3,190 @@ from enum import Enum
 from typing import Annotated
 
 import sqlalchemy
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
-
-from blogapi.core.deps import get_current_user
-from blogapi.database.database import comment_table, database, like_table, post_table
+from databases import Database
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from sqlalchemy.dialects import postgresql
+
+from blogapi.core.config import config
+from blogapi.core.deps import get_current_user, get_read_database
+from blogapi.core.http_cache import (
+    etag_matches,
+    make_etag,
+    not_modified,
+    set_cache_headers,
+)
+from blogapi.core.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    invalid_cursor_exception,
+)
+from blogapi.core.response_cache import feed_cache
+from blogapi.database.database import (
+    comment_table,
+    database,
+    like_table,
+    post_table,
+    post_version_seq,
+)
+from blogapi.database.replica import ReplicaRouter
+from blogapi.database.statements import BoundStatement, CachedStatement
 from blogapi.models.post import (
     Comment,
     CommentIn,
+    CommentPage,
+    CommentResult,
     PostLike,
     PostLikeIn,
+    PostLikeResult,
     UserPost,
+    UserPostBatch,
     UserPostIn,
+    UserPostPage,
     UserPostWithComments,
-    UserPostWithLikes,
 )
 from blogapi.models.user import User
-from blogapi.service_tasks.tasks import generate_and_add_to_post
+from blogapi.service_tasks import jobs
+from blogapi.service_tasks.like_buffer import LikeBuffer
 
 router = APIRouter(tags=["Posts"])
 
 logger = logging.getLogger(__name__)
 
-select_post_and_likes = (
-    sqlalchemy.select(post_table, sqlalchemy.func.count(like_table.c.id).label("likes"))
-    .select_from(post_table.outerjoin(like_table))
-    .group_by(post_table.c.id)
+# Most comments or likes accepted by one bulk request
+MAX_BULK_ITEMS = 1000
+
+select_post_and_likes = sqlalchemy.select(
+    post_table.c.id,
+    post_table.c.body,
+    post_table.c.user_id,
+    post_table.c.image_url,
+    post_table.c.like_count.label("likes"),
 )
 
 
-async def find_post(post_id: int):
-    logger.info(f"Finding post with id {post_id}")
+find_post_statement = CachedStatement(
+    "find_post",
+    post_table.select().where(post_table.c.id == sqlalchemy.bindparam("post_id")),
+)
+
+
+post_version_statement = CachedStatement(
+    "post_version",
+    sqlalchemy.select(post_table.c.version).where(
+        post_table.c.id == sqlalchemy.bindparam("post_id")
+    ),
+)
+feed_version_statement = CachedStatement(
+    "feed_version", sqlalchemy.select(sqlalchemy.func.max(post_table.c.version))
+)
+
+
+def bump_post_version(post_id) -> sqlalchemy.Update:
+    return (
+        post_table.update()
+        .where(post_table.c.id == post_id)
+        .values(version=post_version_seq.next_value())
+    )
+
+
+def select_insert_likes() -> sqlalchemy.Select:
+    """Insert likes that don't exist yet and bump their posts' like counts.
+
+    Takes the likes as two parallel arrays, user_ids and post_ids, so the
+    SQL is the same however many there are. Returns the inserted likes' id,
+    user_id and post_id. Likes a user already gave and likes of posts that
+    don't exist are skipped.
+    """
+    int_array = postgresql.ARRAY(sqlalchemy.Integer)
+    likes = (
+        sqlalchemy.func.unnest(
+            sqlalchemy.cast(sqlalchemy.bindparam("user_ids"), int_array),
+            sqlalchemy.cast(sqlalchemy.bindparam("post_ids"), int_array),
+        )
+        .table_valued("user_id", "post_id")
+        .render_derived(name="new_likes")
+    )
+    inserted = (
+        postgresql.insert(like_table)
+        .from_select(
+            ["user_id", "post_id"],
+            sqlalchemy.select(likes.c.user_id, post_table.c.id).where(
+                post_table.c.id == likes.c.post_id
+            ),
+        )
+        .on_conflict_do_nothing(constraint="uq_likes_user_id_post_id")
+        .returning(like_table.c.id, like_table.c.user_id, like_table.c.post_id)
+        .cte("inserted")
+    )
+    counts = (
+        sqlalchemy.select(inserted.c.post_id, sqlalchemy.func.count().label("likes"))
+        .group_by(inserted.c.post_id)
+        .subquery()
+    )
+    counted = (
+        post_table.update()
+        .where(post_table.c.id == counts.c.post_id)
+        .values(
+            like_count=post_table.c.like_count + counts.c.likes,
+            version=post_version_seq.next_value(),
+        )
+        .returning(post_table.c.id)
+        .cte("counted")
+    )
+    # Postgres runs the counted update even though the select doesn't read it
+    return sqlalchemy.select(
+        inserted.c.id, inserted.c.user_id, inserted.c.post_id
+    ).add_cte(counted)
 
-    query = post_table.select().where(post_table.c.id == post_id)
 
-    logger.debug(query)
+insert_likes_statement = CachedStatement("insert_likes", select_insert_likes())
 
-    return await database.fetch_one(query)
+
+def insert_likes(likes: list[dict]) -> BoundStatement:
+    return insert_likes_statement.bind(
+        user_ids=[like["user_id"] for like in likes],
+        post_ids=[like["post_id"] for like in likes],
+    )
+
+
+async def write_likes(likes: list[tuple[int, int]]) -> None:
+    rows = await database.fetch_all(
+        insert_likes(
+            [{"user_id": user_id, "post_id": post_id} for user_id, post_id in likes]
+        )
+    )
+    if rows:
+        await feed_cache.invalidate()
+
+
+# Used by like_post when config.LIKE_WRITE_BEHIND is set
+like_buffer = LikeBuffer(
+    write_likes,
+    window=config.LIKE_BUFFER_WINDOW,
+    max_size=config.LIKE_BUFFER_MAX_SIZE,
+)
+
+
+async def existing_post_ids(post_ids) -> set[int]:
+    query = sqlalchemy.select(post_table.c.id).where(post_table.c.id.in_(post_ids))
+    return {row["id"] for row in await database.fetch_all(query)}
+
+
+async def find_post(post_id: int):
+    logger.info("Finding post with id %s", post_id)
+
+    return await database.fetch_one(find_post_statement.bind(post_id=post_id))
 
 
 @router.post(
@@ -49,7 +197,6 @@ async def find_post(post_id: int):
 async def create_post(
     post: UserPostIn,
     current_user: Annotated[User, Depends(get_current_user)],
-    background_tasks: BackgroundTasks,
     request: Request,
     prompt: str = "",
 ):
@@ -58,20 +205,22 @@ async def create_post(
     data = {**post.model_dump(), "user_id": current_user.id}
     query = post_table.insert().values(data)
 
-    logger.debug(query)
-
-    last_record_id = await database.execute(query)
-
-    if prompt:
-        background_tasks.add_task(
-            generate_and_add_to_post,
-            current_user.email,
-            last_record_id,
-            str(request.url_for("get_post_with_comments", post_id=last_record_id)),
-            database,
-            prompt,
-        )
-
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+
+        if prompt:
+            await jobs.enqueue(
+                database,
+                "generate_and_add_to_post",
+                email=current_user.email,
+                post_id=last_record_id,
+                post_url=str(
+                    request.url_for("get_post_with_comments", post_id=last_record_id)
+                ),
+                prompt=prompt,
+            )
+
+    await feed_cache.invalidate()
     return {"id": last_record_id, **data}
 
 
@@ -81,21 +230,136 @@ class PostSorting(str, Enum):
     most_likes = "most_likes"
 
 
-@router.get("/post", response_model=list[UserPostWithLikes])
-async def get_all_posts(sorting: PostSorting = PostSorting.new):
-    logger.info("Getting all posts")
-
+def select_feed_page(sorting: PostSorting, after: bool) -> sqlalchemy.Select:
     match sorting:
         case PostSorting.new:
             query = select_post_and_likes.order_by(post_table.c.id.desc())
         case PostSorting.old:
             query = select_post_and_likes.order_by(post_table.c.id.asc())
         case PostSorting.most_likes:
-            query = select_post_and_likes.order_by(sqlalchemy.desc("likes"))
+            # Ties on the like count are broken by id so that the cursor
+            # always points at a single, stable position in the feed
+            query = select_post_and_likes.order_by(
+                post_table.c.like_count.desc(), post_table.c.id.desc()
+            )
+
+    if after:
+        after_id = sqlalchemy.bindparam("after_id")
+        match sorting:
+            case PostSorting.new:
+                query = query.where(post_table.c.id < after_id)
+            case PostSorting.old:
+                query = query.where(post_table.c.id > after_id)
+            case PostSorting.most_likes:
+                query = query.where(
+                    sqlalchemy.tuple_(post_table.c.like_count, post_table.c.id)
+                    < sqlalchemy.tuple_(sqlalchemy.bindparam("after_likes"), after_id)
+                )
+
+    return query.limit(sqlalchemy.bindparam("fetch"))
+
+
+feed_statements = {
+    (sorting, after): CachedStatement(
+        f"feed_{sorting.value}{'_after' if after else ''}",
+        select_feed_page(sorting, after),
+    )
+    for sorting in PostSorting
+    for after in (False, True)
+}
+
+
+@router.get("/post", response_model=UserPostPage)
+async def get_all_posts(
+    request: Request,
+    response: Response,
+    reads: Annotated[Database | ReplicaRouter, Depends(get_read_database)],
+    sorting: PostSorting = PostSorting.new,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+):
+    logger.info("Getting all posts")
+
+    # Fetch one extra row to find out whether there is a next page
+    values = {"fetch": limit + 1}
+    if cursor:
+        after = decode_cursor(cursor, "id", "likes")
+        if after.get("sorting") != sorting.value:
+            raise invalid_cursor_exception()
+
+        values["after_id"] = after["id"]
+        if sorting == PostSorting.most_likes:
+            values["after_likes"] = after["likes"]
+
+    async def feed_version_etag() -> str:
+        # Any change to any post raises the highest version, read it before
+        # the page so the ETag never claims a newer state than the body shows
+        version = await reads.fetch_val(feed_version_statement.bind())
+        return make_etag("feed", sorting.value, limit, cursor, version)
+
+    async def read_page() -> dict:
+        statement = feed_statements[(sorting, bool(cursor))]
+        posts = await reads.fetch_all(statement.bind(**values))
+
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            last = posts[-1]
+            next_cursor = encode_cursor(
+                {"sorting": sorting.value, "id": last["id"], "likes": last["likes"]}
+            )
+
+        return {"items": posts, "next_cursor": next_cursor}
+
+    async def load_cached_page() -> dict:
+        etag = await feed_version_etag()
+        page = UserPostPage.model_validate(await read_page(), from_attributes=True)
+        return {"etag": etag, "page": page.model_dump(mode="json")}
+
+    if "Authorization" in request.headers:
+        # Signed-in callers may have just written, they skip the shared cache
+        etag = await feed_version_etag()
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        page = await read_page()
+    else:
+        cached = await feed_cache.get(
+            f"{sorting.value}:{limit}:{cursor}", load_cached_page
+        )
+        etag, page = cached["etag"], cached["page"]
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+    set_cache_headers(response, etag)
+    return page
+
+
+# = ANY(array) instead of IN, so the SQL is the same for any number of ids
+posts_by_ids_statement = CachedStatement(
+    "posts_by_ids",
+    select_post_and_likes.where(
+        post_table.c.id
+        == sqlalchemy.any_(
+            sqlalchemy.bindparam("ids", type_=postgresql.ARRAY(sqlalchemy.Integer))
+        )
+    ),
+)
+
 
-    logger.debug(query)
+@router.get("/posts", response_model=UserPostBatch)
+async def get_posts_by_ids(
+    reads: Annotated[Database | ReplicaRouter, Depends(get_read_database)],
+    ids: Annotated[list[int], Query(min_length=1, max_length=MAX_PAGE_SIZE)],
+):
+    logger.info("Getting %s posts by id", len(ids))
 
-    return await database.fetch_all(query)
+    ids = list(dict.fromkeys(ids))
+    rows = await reads.fetch_all(posts_by_ids_statement.bind(ids=ids))
+    posts = {row["id"]: row for row in rows}
+    return {
+        "items": [posts[post_id] for post_id in ids if post_id in posts],
+        "missing": [post_id for post_id in ids if post_id not in posts],
+    }
 
 
 @router.post(
@@ -117,40 +381,170 @@ async def create_comment(
     data = {**comment.model_dump(), "user_id": current_user.id}
     query = comment_table.insert().values(data)
 
-    logger.debug(query)
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await database.execute(bump_post_version(comment.post_id))
 
-    last_record_id = await database.execute(query)
     return {"id": last_record_id, **data}
 
 
-@router.get("/post/{post_id}/comment", response_model=list[Comment])
-async def get_comments_on_post(post_id: int):
+@router.post("/comment/bulk", response_model=list[CommentResult])
+async def create_comments(
+    comments: Annotated[list[CommentIn], Body(max_length=MAX_BULK_ITEMS)],
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    logger.info("Create %s comments", len(comments))
+
+    post_ids = await existing_post_ids({comment.post_id for comment in comments})
+    rows = [
+        {**comment.model_dump(), "user_id": current_user.id}
+        for comment in comments
+        if comment.post_id in post_ids
+    ]
+
+    ids = []
+    if rows:
+        # One multi-row INSERT, the serial ids are drawn in VALUES order
+        query = comment_table.insert().values(rows).returning(comment_table.c.id)
+        async with database.transaction():
+            ids = sorted(row["id"] for row in await database.fetch_all(query))
+            await database.execute(
+                post_table.update()
+                .where(post_table.c.id.in_(post_ids))
+                .values(version=post_version_seq.next_value())
+            )
+
+    created = iter(zip(ids, rows))
+    results = []
+    for comment in comments:
+        if comment.post_id not in post_ids:
+            results.append(
+                {"status": status.HTTP_404_NOT_FOUND, "detail": "Post not found"}
+            )
+            continue
+        comment_id, data = next(created)
+        results.append(
+            {"status": status.HTTP_201_CREATED, "comment": {"id": comment_id, **data}}
+        )
+    return results
+
+
+def select_comments(post_id, after_id=None) -> sqlalchemy.Select:
+    query = (
+        sqlalchemy.select(
+            comment_table.c.id,
+            comment_table.c.body,
+            comment_table.c.post_id,
+            comment_table.c.user_id,
+        )
+        .where(comment_table.c.post_id == post_id)
+        .order_by(comment_table.c.id)
+    )
+    if after_id is not None:
+        query = query.where(comment_table.c.id > after_id)
+    return query
+
+
+comments_statements = {
+    after: CachedStatement(
+        f"comments{'_after' if after else ''}",
+        select_comments(
+            sqlalchemy.bindparam("post_id"),
+            sqlalchemy.bindparam("after_id") if after else None,
+        ).limit(sqlalchemy.bindparam("fetch")),
+    )
+    for after in (False, True)
+}
+
+
+def comments_page(comments: list, limit: int) -> dict:
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_cursor({"id": comments[-1]["id"]})
+
+    return {"items": comments, "next_cursor": next_cursor}
+
+
+@router.get("/post/{post_id}/comment", response_model=CommentPage)
+async def get_comments_on_post(
+    post_id: int,
+    reads: Annotated[Database | ReplicaRouter, Depends(get_read_database)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+):
     logger.info("Getting comments on post")
 
-    query = comment_table.select().where(comment_table.c.post_id == post_id)
+    # Fetch one extra row to find out whether there is a next page
+    values = {"post_id": post_id, "fetch": limit + 1}
+    if cursor:
+        values["after_id"] = decode_cursor(cursor, "id")["id"]
+
+    statement = comments_statements[bool(cursor)]
+    return comments_page(await reads.fetch_all(statement.bind(**values)), limit)
+
+
+def select_post_with_comments() -> sqlalchemy.Select:
+    # Aggregate the first page of comments into a JSON array next to the post
+    # so the whole page is read in a single round trip
+    first_comments = (
+        select_comments(post_table.c.id)
+        .limit(DEFAULT_PAGE_SIZE + 1)
+        .correlate(post_table)
+        .subquery("c")
+    )
+    comments = (
+        sqlalchemy.select(
+            sqlalchemy.func.coalesce(
+                sqlalchemy.func.json_agg(
+                    postgresql.aggregate_order_by(
+                        first_comments.table_valued(), first_comments.c.id
+                    )
+                ),
+                sqlalchemy.text("'[]'::json"),
+                type_=postgresql.JSON,
+            )
+        )
+        .scalar_subquery()
+        .label("comments")
+    )
+    return select_post_and_likes.add_columns(post_table.c.version, comments).where(
+        post_table.c.id == sqlalchemy.bindparam("post_id")
+    )
 
-    logger.debug(query)
 
-    return await database.fetch_all(query)
+post_with_comments_statement = CachedStatement(
+    "post_with_comments", select_post_with_comments()
+)
 
 
 @router.get("/post/{post_id}", response_model=UserPostWithComments)
-async def get_post_with_comments(post_id: int):
+async def get_post_with_comments(
+    post_id: int,
+    request: Request,
+    response: Response,
+    reads: Annotated[Database | ReplicaRouter, Depends(get_read_database)],
+):
     logger.info("Getting post and its comments")
 
-    query = select_post_and_likes.where(post_table.c.id == post_id)
-
-    logger.debug(query)
+    if request.headers.get("If-None-Match"):
+        version = await reads.fetch_val(post_version_statement.bind(post_id=post_id))
+        etag = make_etag("post", post_id, version)
+        if version is not None and etag_matches(request, etag):
+            return not_modified(etag)
 
-    post = await database.fetch_one(query)
+    post = await reads.fetch_one(post_with_comments_statement.bind(post_id=post_id))
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
         )
 
+    set_cache_headers(response, make_etag("post", post_id, post["version"]))
+    page = comments_page(post["comments"], DEFAULT_PAGE_SIZE)
     return {
         "post": post,
-        "comments": await get_comments_on_post(post_id),
+        "comments": page["items"],
+        "next_comment_cursor": page["next_cursor"],
     }
 
 
@@ -158,18 +552,118 @@ async def get_post_with_comments(post_id: int):
 async def like_post(
     like: PostLikeIn,
     current_user: Annotated[User, Depends(get_current_user)],
+    response: Response,
 ):
     logger.info("Liking post")
 
-    post = await find_post(like.post_id)
-    if not post:
+    data = {**like.model_dump(), "user_id": current_user.id}
+
+    if config.LIKE_WRITE_BEHIND:
+        # Stored later by like_buffer, a like of a missing post is dropped
+        # then, so it gets no id and no 404
+        like_buffer.add(current_user.id, like.post_id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"id": None, **data}
+
+    # Insert the like only if the post exists and the user has not liked it
+    # yet, and bump the post's like count in the same statement
+    inserted = (
+        postgresql.insert(like_table)
+        .from_select(
+            ["user_id", "post_id"],
+            sqlalchemy.select(
+                sqlalchemy.literal(current_user.id), post_table.c.id
+            ).where(post_table.c.id == like.post_id),
+        )
+        .on_conflict_do_nothing(constraint="uq_likes_user_id_post_id")
+        .returning(like_table.c.id, like_table.c.post_id)
+        .cte("inserted")
+    )
+    query = (
+        post_table.update()
+        .where(post_table.c.id == inserted.c.post_id)
+        .values(
+            like_count=post_table.c.like_count + 1,
+            version=post_version_seq.next_value(),
+        )
+        .returning(inserted.c.id)
+    )
+
+    last_record_id = await database.fetch_val(query)
+    if last_record_id is not None:
+        await feed_cache.invalidate()
+        return {"id": last_record_id, **data}
+
+    query = sqlalchemy.select(like_table.c.id).where(
+        like_table.c.user_id == current_user.id,
+        like_table.c.post_id == like.post_id,
+    )
+
+    existing_id = await database.fetch_val(query)
+    if existing_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Post not found."
         )
-    data = {**like.model_dump(), "user_id": current_user.id}
-    query = like_table.insert().values(data)
 
-    logger.debug(query)
+    # Liking a post twice is a no-op that returns the existing like
+    response.status_code = status.HTTP_200_OK
+    return {"id": existing_id, **data}
 
-    last_record_id = await database.execute(query)
-    return {"id": last_record_id, **data}
+
+@router.post("/like/bulk", response_model=list[PostLikeResult])
+async def like_posts(
+    likes: Annotated[list[PostLikeIn], Body(max_length=MAX_BULK_ITEMS)],
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    logger.info("Liking %s posts", len(likes))
+
+    post_ids = await existing_post_ids({like.post_id for like in likes})
+    like_ids: dict[int, int] = {}
+    inserted: set[int] = set()
+    if post_ids:
+        async with database.transaction():
+            rows = await database.fetch_all(
+                insert_likes(
+                    [
+                        {"user_id": current_user.id, "post_id": post_id}
+                        for post_id in sorted(post_ids)
+                    ]
+                )
+            )
+            inserted = {row["post_id"] for row in rows}
+            like_ids = {row["post_id"]: row["id"] for row in rows}
+
+            if missing := post_ids - inserted:
+                query = sqlalchemy.select(like_table.c.id, like_table.c.post_id).where(
+                    like_table.c.user_id == current_user.id,
+                    like_table.c.post_id.in_(missing),
+                )
+                for row in await database.fetch_all(query):
+                    like_ids[row["post_id"]] = row["id"]
+
+    if inserted:
+        await feed_cache.invalidate()
+
+    results = []
+    for like in likes:
+        if like.post_id not in post_ids:
+            results.append(
+                {"status": status.HTTP_404_NOT_FOUND, "detail": "Post not found."}
+            )
+            continue
+        # Like like_post, liking a post again returns the existing like with
+        # a 200, this includes the same post listed twice in the request
+        results.append(
+            {
+                "status": status.HTTP_201_CREATED
+                if like.post_id in inserted
+                else status.HTTP_200_OK,
+                "like": {
+                    "id": like_ids[like.post_id],
+                    "post_id": like.post_id,
+                    "user_id": current_user.id,
+                },
+            }
+        )
+        inserted.discard(like.post_id)
+    return results
@@ -1,36 +1,131 @@
+import asyncio
 import logging
-import tempfile
 
-import aiofiles
-from fastapi import APIRouter, HTTPException, UploadFile, status
+from fastapi import APIRouter, HTTPException, Request, status
 
-from blogapi.libs.b2 import b2_upload_file
+from blogapi.core.config import config
+from blogapi.core.multipart import MultipartError, iter_multipart
+from blogapi.database.database import database
+from blogapi.libs.b2 import (
+    ChunkReader,
+    SizeLimitedReader,
+    UploadIncompleteError,
+    UploadTooLargeError,
+    b2_upload_deduplicated,
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-CHUNK_SIZE = 1024 * 1024
+# Room for the multipart boundaries, part headers and other form fields
+# around the file when checking Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
 
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {"file": {"type": "string", "format": "binary"}},
+                "required": ["file"],
+            }
+        }
+    },
+}
 
-@router.post("/upload", status_code=201)
-async def upload_file(file: UploadFile):
+
+def upload_too_large_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File is larger than the limit of {config.MAX_UPLOAD_SIZE} bytes",
+    )
+
+
+def ignore_result(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+async def upload_from(reader: ChunkReader, filename: str | None) -> str:
+    try:
+        return await b2_upload_deduplicated(
+            database, SizeLimitedReader(reader, config.MAX_UPLOAD_SIZE), filename
+        )
+    finally:
+        reader.close()
+
+
+@router.post(
+    "/upload", status_code=201, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY}
+)
+async def upload_file(request: Request):
+    """Stream the "file" field of a multipart form to B2 as it is received.
+
+    The body is parsed here rather than with an UploadFile parameter, which
+    would have Starlette store the whole file, on local disk above 1MB,
+    before the handler runs.
+    """
+    content_length = request.headers.get("Content-Length")
+    if (
+        content_length
+        and content_length.isdigit()
+        and int(content_length) > config.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+    ):
+        raise upload_too_large_exception()
+
+    reader = ChunkReader()
+    upload: asyncio.Task | None = None
+    filename = None
+    receiving = False
     try:
-        with tempfile.NamedTemporaryFile() as temp_file:
-            filename = temp_file.name
-            logger.info("Saving uploaded file temporarily to {filename}")
-            async with aiofiles.open(filename, "wb") as f:
-                while chunk := await file.read(CHUNK_SIZE):
-                    await f.write(chunk)
-
-            file_url = b2_upload_file(
-                local_file=filename,
-                filename=file.filename,
-            )
-    except Exception:
+        async for kind, value in iter_multipart(request.headers, request.stream()):
+            if kind == "part" and upload is None and value[0] == "file":
+                filename = value[1]
+                logger.info("Streaming uploaded file %s to B2", filename)
+                upload = asyncio.create_task(upload_from(reader, filename))
+                receiving = True
+            elif not receiving:
+                continue
+            elif kind == "data" and not await reader.send(value):
+                # The upload stopped reading, its task has the error
+                break
+            elif kind == "end":
+                reader.finish()
+                receiving = False
+    except BaseException as e:
+        # The upload fails with UploadIncompleteError, nobody waits for it
+        reader.abort()
+        if upload is not None:
+            upload.add_done_callback(ignore_result)
+        if isinstance(e, MultipartError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+            ) from e
+        raise
+    # Does nothing after finish(), otherwise the body ended before the file did
+    reader.abort()
+
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Missing "file" field in the upload',
+        )
+
+    try:
+        file_url = await upload
+    except UploadTooLargeError as e:
+        raise upload_too_large_exception() from e
+    except UploadIncompleteError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Upload ended early"
+        ) from e
+    except Exception as e:
+        logger.exception("Error uploading file to B2")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="There was an error uploading the file",
-        )
+        ) from e
 
-    return {"detail": f"Successfully uploaded {file.filename}", "file_url": {file_url}}
+    return {"detail": f"Successfully uploaded {filename}", "file_url": file_url}
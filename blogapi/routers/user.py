@@ -1,16 +1,21 @@
 import logging
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, status
+from fastapi import APIRouter, HTTPException, Request, status
 
-from blogapi.core.deps import authenticate_user, get_subject_for_token_type, get_user
+from blogapi.core.deps import (
+    authenticate_user,
+    get_subject_for_token_type,
+    get_user,
+    user_cache,
+)
 from blogapi.core.security import (
     create_access_token,
     create_confirmation_token,
-    get_password_hash,
+    get_password_hash_async,
 )
 from blogapi.database.database import database, user_table
 from blogapi.models.user import UserIn
-from blogapi.service_tasks import tasks
+from blogapi.service_tasks import jobs
 
 logger = logging.getLogger(__name__)
 
@@ -18,29 +23,30 @@ router = APIRouter(tags=["users"])
 
 
 @router.post("/register", status_code=201)
-async def register(user: UserIn, background_tasks: BackgroundTasks, request: Request):
+async def register(user: UserIn, request: Request):
     if await get_user(user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A user with that email already exists!",
         )
     #    Hashed password
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     query = user_table.insert().values(email=user.email, password=hashed_password)
 
-    logger.debug(query)
-
-    await database.execute(query)
-
-    background_tasks.add_task(
-        tasks.send_user_registration_email,
-        user.email,
-        confirmation_url=str(
-            request.url_for(
-                "confirm_email", token=create_confirmation_token(user.email)
-            )
-        ),
-    )
+    # The email job is queued in the same transaction, so it is only sent if
+    # the user was created and is never lost once they are
+    async with database.transaction():
+        await database.execute(query)
+        await jobs.enqueue(
+            database,
+            "send_user_registration_email",
+            email=user.email,
+            confirmation_url=str(
+                request.url_for(
+                    "confirm_email", token=create_confirmation_token(user.email)
+                )
+            ),
+        )
 
     return {"detail": "User Created. Please confirm your email."}
 
@@ -64,7 +70,7 @@ async def confirm_email(token: str):
         user_table.update().where(user_table.c.email == email).values(confirmed=True)
     )
 
-    logger.debug(query)
-
     await database.execute(query)
+    user_cache.pop(email)
+
     return {"detail": "User confirmed"}
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Mailgun accepts at most 1000 recipients per batch message
+MAILGUN_MAX_BATCH_SIZE = 1000
+
+# send(recipients, subject, text, recipient_variables)
+BatchSender = Callable[[list[str], str, str, dict[str, dict]], Awaitable]
+
+
+@dataclass
+class _Batch:
+    variables: dict[str, dict] = field(default_factory=dict)
+    waiters: list[asyncio.Future] = field(default_factory=list)
+    timer: asyncio.TimerHandle | None = None
+
+
+class EmailOutbox:
+    """Collects emails for a short window and sends them as Mailgun batches.
+
+    Messages with the same subject and text template are sent in one API
+    call, with per-recipient values passed as Mailgun recipient variables
+    and referenced in the template as %recipient.name%. Callers wait until
+    the batch holding their message is sent and get its error if it failed.
+    """
+
+    def __init__(
+        self,
+        send: BatchSender,
+        window: float,
+        max_batch_size: int = MAILGUN_MAX_BATCH_SIZE,
+    ) -> None:
+        self.send_batch = send
+        self.window = window
+        self.max_batch_size = min(max_batch_size, MAILGUN_MAX_BATCH_SIZE)
+        self.batches_sent = 0
+        self.messages_sent = 0
+        self._pending: dict[tuple[str, str], _Batch] = {}
+        self._flushes: set[asyncio.Task] = set()
+
+    async def send(self, to: str, subject: str, text: str, variables: dict) -> None:
+        key = (subject, text)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch()
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.window, self._schedule_flush, key
+            )
+
+        # A recipient queued twice in one window gets a single email
+        batch.variables[to] = variables
+        waiter = asyncio.get_running_loop().create_future()
+        batch.waiters.append(waiter)
+
+        if len(batch.variables) >= self.max_batch_size:
+            self._schedule_flush(key)
+
+        await waiter
+
+    def _schedule_flush(self, key: tuple[str, str]) -> None:
+        # Taken out of the pending map right away, so later messages start a
+        # new batch instead of growing this one past the size limit
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer:
+            batch.timer.cancel()
+
+        task = asyncio.create_task(self._send(key, batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _send(self, key: tuple[str, str], batch: _Batch) -> None:
+        subject, text = key
+        logger.debug("Sending batch of %d emails", len(batch.variables))
+        try:
+            await self.send_batch(list(batch.variables), subject, text, batch.variables)
+        except Exception as e:
+            logger.warning("Sending email batch failed", exc_info=True)
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+        else:
+            self.batches_sent += 1
+            self.messages_sent += len(batch.variables)
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def flush(self) -> None:
+        """Send everything that is pending now, e.g. on shutdown."""
+        for key in list(self._pending):
+            self._schedule_flush(key)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": sum(len(batch.variables) for batch in self._pending.values()),
+            "batches_sent": self.batches_sent,
+            "messages_sent": self.messages_sent,
+        }
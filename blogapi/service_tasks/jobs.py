@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+import sqlalchemy
+from databases import Database
+
+from blogapi.core.config import config
+from blogapi.core.metrics import GaugeMetric, cluster_metrics_registry, task_duration
+from blogapi.database.database import job_table
+from blogapi.service_tasks import tasks
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class JobType:
+    # Called with the worker's database and the job payload as keyword arguments
+    handler: Callable[..., Awaitable]
+    concurrency: int
+    max_attempts: int = config.JOB_MAX_ATTEMPTS
+
+
+async def _send_user_registration_email(database: Database, **payload):
+    await tasks.send_user_registration_email(**payload)
+
+
+async def _generate_and_add_to_post(database: Database, **payload):
+    await tasks.generate_and_add_to_post(database=database, **payload)
+
+
+job_types: dict[str, JobType] = {
+    "send_user_registration_email": JobType(
+        _send_user_registration_email, concurrency=config.JOB_EMAIL_CONCURRENCY
+    ),
+    "generate_and_add_to_post": JobType(
+        _generate_and_add_to_post, concurrency=config.JOB_IMAGE_CONCURRENCY
+    ),
+}
+
+
+async def enqueue(database: Database, job_type: str, **payload) -> int:
+    """Queue a job, in the caller's transaction if there is one."""
+    logger.debug("Enqueuing %s job", job_type)
+
+    if job_type not in job_types:
+        raise ValueError(f"Unknown job type {job_type!r}")
+
+    query = job_table.insert().values(type=job_type, payload=payload)
+    return await database.execute(query)
+
+
+async def queue_depth(database: Database) -> dict[str, dict[str, int]]:
+    """Number of jobs per type and status."""
+    query = sqlalchemy.select(
+        job_table.c.type,
+        job_table.c.status,
+        sqlalchemy.func.count().label("count"),
+    ).group_by(job_table.c.type, job_table.c.status)
+
+    depth: dict[str, dict[str, int]] = {}
+    for row in await database.fetch_all(query):
+        depth.setdefault(row["type"], {})[row["status"]] = row["count"]
+    return depth
+
+
+job_queue_depth = GaugeMetric(
+    "blogapi_job_queue_depth",
+    "Jobs in the queue, by type and status.",
+    ("type", "status"),
+    registry=cluster_metrics_registry,
+)
+
+
+async def collect_queue_depth(database: Database) -> None:
+    depth = await queue_depth(database)
+    # Types and statuses with no jobs left are reported as 0, not dropped
+    for job_type in job_types.keys() | depth.keys():
+        for status in ("queued", "running", "failed"):
+            count = depth.get(job_type, {}).get(status, 0)
+            job_queue_depth.set(count, job_type, status)
+
+
+def retry_delay(attempts: int) -> float:
+    return min(
+        config.JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), config.JOB_RETRY_MAX_DELAY
+    )
+
+
+class JobWorker:
+    """Claims queued jobs and runs them with a concurrency limit per job type.
+
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+    workers, in-process or started with `python -m blogapi.worker`, can share
+    the queue without running a job twice.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        job_types: dict[str, JobType] = job_types,
+        poll_interval: float = config.JOB_POLL_INTERVAL,
+    ) -> None:
+        self.database = database
+        self.job_types = job_types
+        self.poll_interval = poll_interval
+        self.active = {job_type: 0 for job_type in job_types}
+        self.completed = {job_type: 0 for job_type in job_types}
+        self.failed = {job_type: 0 for job_type in job_types}
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    async def claim(self, job_type: str, limit: int) -> list:
+        claimable = (
+            sqlalchemy.select(job_table.c.id)
+            .where(
+                job_table.c.type == job_type,
+                job_table.c.status == "queued",
+                job_table.c.run_at <= sqlalchemy.func.now(),
+            )
+            .order_by(job_table.c.run_at, job_table.c.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        query = (
+            job_table.update()
+            .where(job_table.c.id.in_(claimable.scalar_subquery()))
+            .values(
+                status="running",
+                locked_at=sqlalchemy.func.now(),
+                attempts=job_table.c.attempts + 1,
+            )
+            .returning(*job_table.c)
+        )
+        return await self.database.fetch_all(query)
+
+    async def requeue_stale(self) -> None:
+        """Put back running jobs whose worker died without finishing them.
+
+        A lost job counts as an attempt, so one that keeps killing or hanging
+        its worker is failed once its attempts are used up.
+        """
+        # Cast, asyncpg can't tell the parameter types from a CASE
+        max_attempts = sqlalchemy.case(
+            {
+                job_type: sqlalchemy.cast(spec.max_attempts, sqlalchemy.Integer)
+                for job_type, spec in self.job_types.items()
+            },
+            value=job_table.c.type,
+            else_=sqlalchemy.cast(config.JOB_MAX_ATTEMPTS, sqlalchemy.Integer),
+        )
+        used_up = job_table.c.attempts >= max_attempts
+        query = (
+            job_table.update()
+            .where(
+                job_table.c.status == "running",
+                job_table.c.locked_at
+                < datetime.now(UTC) - timedelta(seconds=config.JOB_LOCK_TIMEOUT),
+            )
+            .values(
+                status=sqlalchemy.case((used_up, "failed"), else_="queued"),
+                locked_at=None,
+                last_error=sqlalchemy.case(
+                    (used_up, "Worker lost the job"), else_=job_table.c.last_error
+                ),
+            )
+            .returning(job_table.c.id, job_table.c.type, job_table.c.status)
+        )
+        stale = await self.database.fetch_all(query)
+        failed = [job for job in stale if job["status"] == "failed"]
+        for job in failed:
+            if job["type"] in self.failed:
+                self.failed[job["type"]] += 1
+        if failed:
+            logger.error(
+                "Failed %d stale jobs that used up their attempts: %s",
+                len(failed),
+                [job["id"] for job in failed],
+            )
+        if len(stale) > len(failed):
+            logger.warning("Requeued %d stale jobs", len(stale) - len(failed))
+
+    async def run_once(self) -> int:
+        """Claim as many jobs as there are free slots and start them."""
+        claimed = 0
+        for job_type, spec in self.job_types.items():
+            free = spec.concurrency - self.active[job_type]
+            if free <= 0:
+                continue
+
+            for job in await self.claim(job_type, free):
+                self.active[job_type] += 1
+                task = asyncio.create_task(self._execute(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                claimed += 1
+
+        return claimed
+
+    async def _execute(self, job) -> None:
+        job_type = job["type"]
+        started = time.perf_counter()
+        try:
+            await self.job_types[job_type].handler(self.database, **job["payload"])
+        except Exception as e:
+            task_duration.observe(time.perf_counter() - started, job_type, "error")
+            logger.warning("Job %s (%s) raised", job["id"], job_type, exc_info=True)
+            await self._fail(job, e)
+        else:
+            task_duration.observe(time.perf_counter() - started, job_type, "done")
+            await self.database.execute(
+                job_table.delete().where(job_table.c.id == job["id"])
+            )
+            self.completed[job_type] += 1
+            logger.debug(
+                "Job %s (%s) done in %.3fs",
+                job["id"],
+                job_type,
+                time.perf_counter() - started,
+            )
+        finally:
+            self.active[job_type] -= 1
+
+    async def _fail(self, job, error: Exception) -> None:
+        values = {"locked_at": None, "last_error": repr(error)}
+        if job["attempts"] >= self.job_types[job["type"]].max_attempts:
+            logger.error(
+                "Job %s (%s) failed for good after %d attempts",
+                job["id"],
+                job["type"],
+                job["attempts"],
+            )
+            values["status"] = "failed"
+            self.failed[job["type"]] += 1
+        else:
+            delay = retry_delay(job["attempts"])
+            logger.info("Retrying job %s (%s) in %ss", job["id"], job["type"], delay)
+            values["status"] = "queued"
+            values["run_at"] = datetime.now(UTC) + timedelta(seconds=delay)
+
+        await self.database.execute(
+            job_table.update().where(job_table.c.id == job["id"]).values(**values)
+        )
+
+    async def run(self) -> None:
+        logger.info("Job worker started")
+        last_requeue = 0.0
+        while not self._stopping.is_set():
+            try:
+                if time.monotonic() - last_requeue > config.JOB_LOCK_TIMEOUT / 2:
+                    await self.requeue_stale()
+                    last_requeue = time.monotonic()
+                claimed = await self.run_once()
+            except Exception:
+                logger.exception("Job worker poll failed")
+                claimed = 0
+
+            if not claimed:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except TimeoutError:
+                    pass
+
+        await self.drain()
+        logger.info("Job worker stopped")
+
+    async def drain(self) -> None:
+        """Wait for the jobs that are currently running."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def stats(self) -> dict:
+        return {
+            "active": dict(self.active),
+            "completed": dict(self.completed),
+            "failed": dict(self.failed),
+        }
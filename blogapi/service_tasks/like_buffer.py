@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# write(likes) stores a batch of (user_id, post_id) pairs
+LikeWriter = Callable[[list[tuple[int, int]]], Awaitable]
+
+
+class LikeBuffer:
+    """Collects likes in memory and writes them behind the request in batches.
+
+    A like is kept once per (user, post) until the batch holding it is
+    written, `window` seconds after the batch's first like or as soon as it
+    reaches `max_size` likes. Batches are written one at a time.
+
+    Likes are acknowledged before they are stored, so some can be lost:
+    - on a crash, everything still buffered, at most `window` seconds or
+      `max_size` likes, plus the batch being written;
+    - when writing a batch fails, that batch, it is logged and counted in
+      `dropped` rather than retried.
+    A clean shutdown loses nothing as long as `flush()` is awaited.
+    """
+
+    def __init__(self, write: LikeWriter, window: float, max_size: int) -> None:
+        self.write = write
+        self.window = window
+        self.max_size = max_size
+        self.batches_written = 0
+        self.likes_written = 0
+        self.dropped = 0
+        self._pending: dict[tuple[int, int], None] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._writes: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    def add(self, user_id: int, post_id: int) -> None:
+        if not self._pending:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window, self._schedule_write
+            )
+
+        self._pending[(user_id, post_id)] = None
+        if len(self._pending) >= self.max_size:
+            self._schedule_write()
+
+    def _schedule_write(self) -> None:
+        # Swapped out right away, so later likes start a new batch
+        batch, self._pending = list(self._pending), {}
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._write(batch))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: list[tuple[int, int]]) -> None:
+        # One batch at a time, concurrent batches bumping the same posts
+        # would only contend for their row locks
+        async with self._lock:
+            logger.debug("Writing batch of %d likes", len(batch))
+            try:
+                await self.write(batch)
+            except Exception:
+                logger.warning(
+                    "Writing likes failed, dropped %d", len(batch), exc_info=True
+                )
+                self.dropped += len(batch)
+            else:
+                self.batches_written += 1
+                self.likes_written += len(batch)
+
+    async def flush(self) -> None:
+        """Write everything that is buffered now, e.g. on shutdown."""
+        self._schedule_write()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches_written": self.batches_written,
+            "likes_written": self.likes_written,
+            "dropped": self.dropped,
+        }
@@ -1,11 +1,19 @@
+import asyncio
+import json
 import logging
+import time
 from json import JSONDecodeError
 
 import httpx
+import sqlalchemy
 from databases import Database
 
 from blogapi.core.config import config
-from blogapi.database.database import post_table
+from blogapi.core.http_clients import http_clients
+from blogapi.core.metrics import task_duration
+from blogapi.core.response_cache import feed_cache
+from blogapi.database.database import like_table, post_table, post_version_seq
+from blogapi.service_tasks.email_outbox import EmailOutbox
 
 logger = logging.getLogger(__name__)
 
@@ -14,67 +22,95 @@ class APIResponseError(Exception):
     pass
 
 
+async def _send_mailgun_message(data: dict) -> httpx.Response:
+    client = http_clients.get("mailgun")
+    try:
+        response = await client.post(
+            f"/{config.MAILGUN_DOMAIN}/messages",
+            auth=("api", config.MAILGUN_API_KEY),
+            data={"from": f"Addisu Haile <mailgun@{config.MAILGUN_DOMAIN}>", **data},
+        )
+
+        response.raise_for_status()
+
+        logger.debug(response.content)
+        return response
+
+    except httpx.HTTPStatusError as err:
+        logger.error("Error: %s", err)
+        raise APIResponseError(
+            f"API request failed with status code {err.response.status_code}"
+        ) from err
+
+
 # send email
 async def send_simple_email(to: str, subject: str, body: str):
-    logger.debug(f"Sending email to '{to[:3]}' with subject '{subject[:20]}'")
+    logger.debug("Sending email to '%s' with subject '%s'", to[:3], subject[:20])
+    return await _send_mailgun_message({"to": [to], "subject": subject, "text": body})
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"https://api.mailgun.net/v3/{config.MAILGUN_DOMAIN}/messages",
-                auth=("api", config.MAILGUN_API_KEY),
-                data={
-                    "from": f"Addisu Haile <mailgun@{config.MAILGUN_DOMAIN}>",
-                    "to": [to],
-                    "subject": subject,
-                    "text": body,
-                },
-            )
 
-            response.raise_for_status()
+# send one email to many recipients, Mailgun fills in %recipient.<name>%
+# placeholders in the text from each recipient's variables
+async def send_batch_email(
+    recipients: list[str],
+    subject: str,
+    body: str,
+    recipient_variables: dict[str, dict],
+):
+    logger.debug(
+        "Sending batch email to %d recipients with subject '%s'",
+        len(recipients),
+        subject[:20],
+    )
+    return await _send_mailgun_message(
+        {
+            "to": recipients,
+            "subject": subject,
+            "text": body,
+            "recipient-variables": json.dumps(recipient_variables),
+        }
+    )
 
-            logger.debug(response.content)
-            return response
 
-        except httpx.HTTPStatusError as err:
-            logger.error(f"Error: {err}")
-            raise APIResponseError(
-                f"API request failed with status code {err.response.status_code}"
-            ) from err
+email_outbox = EmailOutbox(
+    send_batch_email,
+    window=config.EMAIL_BATCH_WINDOW,
+    max_batch_size=config.EMAIL_BATCH_MAX_SIZE,
+)
 
 
 async def send_user_registration_email(email: str, confirmation_url: str):
-    return await send_simple_email(
+    await email_outbox.send(
         email,
         "Successfully signed up",
         (
-            f"Hi {email}! You have successfully signed up to the Blog REST API."
+            "Hi %recipient.email%! You have successfully signed up to the Blog REST API."
             "Please confirm your email by clicking on the"
-            f" following link: {confirmation_url}"
+            " following link: %recipient.confirmation_url%"
         ),
+        {"email": email, "confirmation_url": confirmation_url},
     )
 
 
 # Generate ai_image
 async def _generate_cute_creature_api(prompt: str):
     logger.debug("Generating cute creature")
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                "https://api.deepai.org/api/cute-creature-generator",
-                params={"text": prompt},
-                headers={"api-key": config.DEEPAI_API_KEY},
-                timeout=60,
-            )
-            logger.debug(response)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as err:
-            raise APIResponseError(
-                f"API request failed with status code {err.response.status_code}"
-            ) from err
-        except (JSONDecodeError, TypeError) as err:
-            raise APIResponseError("API response parsing failed") from err
+    client = http_clients.get("deepai")
+    try:
+        response = await client.post(
+            "/cute-creature-generator",
+            params={"text": prompt},
+            headers={"api-key": config.DEEPAI_API_KEY},
+        )
+        logger.debug(response)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as err:
+        raise APIResponseError(
+            f"API request failed with status code {err.response.status_code}"
+        ) from err
+    except (JSONDecodeError, TypeError) as err:
+        raise APIResponseError("API response parsing failed") from err
 
 
 async def generate_and_add_to_post(
@@ -101,12 +137,11 @@ async def generate_and_add_to_post(
     query = (
         post_table.update()
         .where(post_table.c.id == post_id)
-        .values(image_url=response["output_url"])
+        .values(image_url=response["output_url"], version=post_version_seq.next_value())
     )
 
-    logger.debug(query)
-
     await database.execute(query)
+    await feed_cache.invalidate()
 
     logger.debug("Database connection in background task closed")
 
@@ -119,3 +154,47 @@ async def generate_and_add_to_post(
         ),
     )
     return response
+
+
+# Repair drift in the denormalized posts.like_count column
+async def reconcile_like_counts(database: Database) -> int:
+    logger.debug("Reconciling post like counts")
+
+    counts = (
+        sqlalchemy.select(
+            post_table.c.id, sqlalchemy.func.count(like_table.c.id).label("likes")
+        )
+        .select_from(post_table.outerjoin(like_table))
+        .group_by(post_table.c.id)
+        .subquery()
+    )
+    query = (
+        post_table.update()
+        .where(post_table.c.id == counts.c.id)
+        .where(post_table.c.like_count != counts.c.likes)
+        .values(like_count=counts.c.likes, version=post_version_seq.next_value())
+        .returning(post_table.c.id)
+    )
+
+    repaired = await database.fetch_all(query)
+    if repaired:
+        logger.warning("Repaired like counts of %d posts", len(repaired))
+        await feed_cache.invalidate()
+
+    return len(repaired)
+
+
+async def reconcile_like_counts_periodically(database: Database, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            await reconcile_like_counts(database)
+            outcome = "done"
+        except Exception:
+            logger.exception("Like count reconciliation failed")
+        finally:
+            task_duration.observe(
+                time.perf_counter() - started, "reconcile_like_counts", outcome
+            )
@@ -8,6 +8,9 @@ from httpx import ASGITransport, AsyncClient, Request, Response
 
 os.environ["ENV_STATE"] = "test"
 
+from blogapi.core.deps import user_cache
+from blogapi.core.http_clients import http_clients
+from blogapi.core.response_cache import feed_cache
 from blogapi.database.database import database, metadata, user_table
 from blogapi.main import app
 from blogapi.tests.helpers import create_post
@@ -33,6 +36,8 @@ async def db() -> AsyncGenerator:
         await database.execute(
             f'TRUNCATE TABLE "{table.name}" RESTART IDENTITY CASCADE;'
         )
+    user_cache.clear()
+    await feed_cache.invalidate()
     yield database
     await database.disconnect()
 
@@ -82,12 +87,10 @@ async def logged_in_token(async_client: AsyncClient, confirmed_user: dict) -> st
 
 @pytest.fixture(autouse=True)
 def mock_httpx_client(mocker):
-    mocked_client = mocker.patch("blogapi.service_tasks.tasks.httpx.AsyncClient")
-
     mocked_async_client = Mock()
     response = Response(status_code=200, content="", request=Request("POST", "//"))
     mocked_async_client.post = AsyncMock(return_value=response)
-    mocked_client.return_value.__aenter__.return_value = mocked_async_client
+    mocker.patch.object(http_clients, "get", return_value=mocked_async_client)
 
     return mocked_async_client
 
@@ -0,0 +1,50 @@
+from blogapi.core.cache import TTLCache
+
+
+class FakeTimer:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_get_and_set():
+    cache = TTLCache(max_size=2, ttl=10)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert {"hits": 1, "misses": 1, "size": 1}.items() <= cache.stats().items()
+
+
+def test_ttl_cache_expires_entries():
+    timer = FakeTimer()
+    cache = TTLCache(max_size=2, ttl=10, timer=timer)
+    cache.set("a", 1)
+
+    timer.now = 10
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_pop():
+    cache = TTLCache(max_size=2, ttl=10)
+    cache.set("a", 1)
+
+    assert cache.pop("a") == 1
+    assert cache.get("a") is None
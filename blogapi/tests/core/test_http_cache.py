@@ -0,0 +1,32 @@
+import pytest
+from starlette.requests import Request
+
+from blogapi.core.http_cache import etag_matches, make_etag
+
+
+def request_with(if_none_match: str | None) -> Request:
+    headers = (
+        [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    )
+    return Request({"type": "http", "headers": headers})
+
+
+def test_make_etag():
+    assert make_etag("post", 1, 5) == make_etag("post", 1, 5)
+    assert make_etag("post", 1, 5) != make_etag("post", 1, 6)
+    assert make_etag("post", 1, 5).startswith('"')
+
+
+@pytest.mark.parametrize(
+    "header, matches",
+    [
+        (None, False),
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"xyz", "abc"', True),
+        ('"xyz"', False),
+        ("*", True),
+    ],
+)
+def test_etag_matches(header: str | None, matches: bool):
+    assert etag_matches(request_with(header), '"abc"') is matches
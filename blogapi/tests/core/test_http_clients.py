@@ -0,0 +1,50 @@
+import httpx
+import pytest
+
+from blogapi.core.http_clients import HTTPClients, Upstream
+from blogapi.core.metrics import upstream_request_duration
+
+
+@pytest.fixture()
+def clients() -> HTTPClients:
+    return HTTPClients(
+        {"example": Upstream("https://example.com", timeout=3, max_connections=2)}
+    )
+
+
+@pytest.mark.anyio
+async def test_http_clients_reuse_client(clients: HTTPClients):
+    client = clients.get("example")
+
+    assert clients.get("example") is client
+    assert str(client.base_url) == "https://example.com"
+    assert client.timeout.read == 3
+
+    await clients.aclose()
+
+
+@pytest.mark.anyio
+async def test_http_clients_aclose(clients: HTTPClients):
+    clients.open()
+    client = clients.get("example")
+
+    await clients.aclose()
+
+    assert client.is_closed
+    assert clients.get("example") is not client
+
+    await clients.aclose()
+
+
+@pytest.mark.anyio
+async def test_http_clients_time_calls():
+    clients = HTTPClients(
+        {"closed": Upstream("http://127.0.0.1:1", timeout=3, max_connections=2)}
+    )
+    assert ("closed", "error") not in upstream_request_duration.values
+
+    with pytest.raises(httpx.ConnectError):
+        await clients.get("closed").get("/")
+
+    assert upstream_request_duration.values[("closed", "error")].count == 1
+    await clients.aclose()
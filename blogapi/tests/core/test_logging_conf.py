@@ -0,0 +1,169 @@
+import logging
+import queue
+
+from asgi_correlation_id import CorrelationIdFilter, correlation_id
+
+from blogapi.core.logging_conf import (
+    BoundedQueueHandler,
+    HandlerDispatchListener,
+    SamplingFilter,
+    start_queue_logging,
+)
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def make_record(msg: str) -> logging.LogRecord:
+    return logging.makeLogRecord(
+        {"name": "blogapi", "msg": msg, "levelno": logging.INFO, "levelname": "INFO"}
+    )
+
+
+def queued_messages(log_queue: queue.Queue) -> list[str]:
+    messages = []
+    while not log_queue.empty():
+        messages.append(log_queue.get_nowait().getMessage())
+    return messages
+
+
+def test_queue_handler_defers_to_listener():
+    log_queue = queue.Queue(10)
+    target = RecordingHandler()
+    handler = BoundedQueueHandler(log_queue, [target])
+
+    handler.handle(make_record("hello %s"))
+
+    assert target.records == []
+    assert log_queue.qsize() == 1
+
+    listener = HandlerDispatchListener(log_queue)
+    listener.start()
+    listener.stop()
+
+    [record] = target.records
+    assert record.getMessage() == "hello %s"
+    assert not hasattr(record, "log_targets")
+
+
+def test_queue_handler_captures_correlation_id():
+    log_queue = queue.Queue(10)
+    target = RecordingHandler()
+    handler = BoundedQueueHandler(log_queue, [target])
+    handler.addFilter(CorrelationIdFilter(default_value="-"))
+
+    token = correlation_id.set("abc123")
+    try:
+        handler.handle(make_record("in request"))
+    finally:
+        correlation_id.reset(token)
+
+    listener = HandlerDispatchListener(log_queue)
+    listener.start()
+    listener.stop()
+
+    assert target.records[0].correlation_id == "abc123"
+
+
+def test_drop_new():
+    log_queue = queue.Queue(2)
+    handler = BoundedQueueHandler(log_queue, [], drop_policy="drop_new")
+
+    for i in range(4):
+        handler.handle(make_record(str(i)))
+
+    assert handler.dropped == 2
+    assert queued_messages(log_queue) == ["0", "1"]
+
+
+def test_drop_oldest():
+    log_queue = queue.Queue(2)
+    handler = BoundedQueueHandler(log_queue, [], drop_policy="drop_oldest")
+
+    for i in range(4):
+        handler.handle(make_record(str(i)))
+
+    messages = queued_messages(log_queue)
+    assert messages[-1] == "3"
+    assert messages[0].startswith("Log queue full, dropped")
+
+
+def test_dropped_records_reported():
+    log_queue = queue.Queue(2)
+    handler = BoundedQueueHandler(log_queue, [], drop_policy="drop_new")
+
+    for i in range(3):
+        handler.handle(make_record(str(i)))
+    queued_messages(log_queue)
+    handler.handle(make_record("3"))
+
+    assert queued_messages(log_queue) == ["Log queue full, dropped 1 records", "3"]
+
+
+def test_start_queue_logging_keeps_logger_handlers():
+    logger = logging.getLogger("blogapi.tests.queue_logging")
+    target = RecordingHandler()
+    target.setLevel(logging.WARNING)
+    logger.handlers = [target]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+
+    listener = start_queue_logging(
+        [logger.name], 10, "drop_new", CorrelationIdFilter(default_value="-")
+    )
+    try:
+        assert [type(handler) for handler in logger.handlers] == [BoundedQueueHandler]
+        logger.info("below the handler level")
+        logger.warning("delivered")
+    finally:
+        listener.stop()
+        logger.handlers = []
+
+    assert [record.getMessage() for record in target.records] == ["delivered"]
+    assert target.records[0].correlation_id == "-"
+
+
+class FakeTimer:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_sampling_filter_rate(mocker):
+    mocker.patch("blogapi.core.logging_conf.random.random", side_effect=[0.1, 0.6])
+    sampling = SamplingFilter(rate=0.5)
+
+    assert sampling.filter(make_record("kept"))
+    assert not sampling.filter(make_record("dropped"))
+    assert sampling.dropped == 1
+
+
+def test_sampling_filter_rate_limit():
+    timer = FakeTimer()
+    sampling = SamplingFilter(max_per_second=2, timer=timer)
+
+    assert [sampling.filter(make_record(str(i))) for i in range(3)] == [
+        True,
+        True,
+        False,
+    ]
+
+    timer.now = 0.5
+    assert sampling.filter(make_record("refilled"))
+    assert not sampling.filter(make_record("limited"))
+
+
+def test_sampling_filter_keeps_warnings():
+    sampling = SamplingFilter(rate=0)
+    record = make_record("warning")
+    record.levelno = logging.WARNING
+
+    assert sampling.filter(record)
@@ -0,0 +1,129 @@
+import os
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from blogapi.core.metrics import (
+    CounterMetric,
+    GaugeMetric,
+    HistogramMetric,
+    MetricsRegistry,
+    MetricsStore,
+    merge_snapshots,
+    render,
+)
+
+
+@pytest.fixture()
+def registry() -> MetricsRegistry:
+    return MetricsRegistry()
+
+
+def test_render_counter_and_gauge(registry: MetricsRegistry):
+    requests = CounterMetric(
+        "requests_total", "Requests.", ("route",), registry=registry
+    )
+    in_progress = GaugeMetric("in_progress", "In progress.", registry=registry)
+    requests.inc("/post")
+    requests.inc("/post", amount=2)
+    requests.inc('/say "hi"')
+    in_progress.inc()
+    in_progress.inc()
+    in_progress.dec()
+
+    assert render(registry.snapshot()) == (
+        "# HELP in_progress In progress.\n"
+        "# TYPE in_progress gauge\n"
+        "in_progress 1\n"
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/post"} 3\n'
+        'requests_total{route="/say \\"hi\\""} 1\n'
+    )
+
+
+def test_render_histogram(registry: MetricsRegistry):
+    duration = HistogramMetric(
+        "duration_seconds", "Duration.", ("route",), registry=registry, buckets=(0.1, 1)
+    )
+    duration.observe(0.05, "/post")
+    duration.observe(0.5, "/post")
+    duration.observe(5, "/post")
+
+    assert render(registry.snapshot()).splitlines()[2:] == [
+        'duration_seconds_bucket{route="/post",le="0.1"} 1',
+        'duration_seconds_bucket{route="/post",le="1"} 2',
+        'duration_seconds_bucket{route="/post",le="+Inf"} 3',
+        'duration_seconds_sum{route="/post"} 5.55',
+        'duration_seconds_count{route="/post"} 3',
+    ]
+
+
+def test_collectors_run_before_snapshot(registry: MetricsRegistry):
+    size = GaugeMetric("size", "Size.", registry=registry)
+    registry.add_collector(lambda: size.set(42))
+
+    assert registry.snapshot()["size"]["samples"] == [[[], 42]]
+
+
+def test_merge_snapshots(registry: MetricsRegistry):
+    requests = CounterMetric(
+        "requests_total", "Requests.", ("route",), registry=registry
+    )
+    duration = HistogramMetric(
+        "duration_seconds", "Duration.", registry=registry, buckets=(1,)
+    )
+    requests.inc("/post")
+    duration.observe(0.5)
+    first = registry.snapshot()
+    requests.inc("/like")
+    duration.observe(2)
+    second = registry.snapshot()
+
+    merged = merge_snapshots([first, second])
+
+    assert merged["requests_total"]["samples"] == [[["/post"], 2], [["/like"], 1]]
+    assert merged["duration_seconds"]["samples"] == [
+        [[], {"buckets": {"1": 2, "inf": 3}, "sum": 3.0, "count": 3}]
+    ]
+
+
+def test_metrics_store_reads_all_workers(registry: MetricsRegistry, tmp_path):
+    requests = CounterMetric("requests_total", "Requests.", registry=registry)
+    requests.inc()
+    stores = [MetricsStore(str(tmp_path), stale_after=60) for _ in range(3)]
+    for i, store in enumerate(stores):
+        store.path = str(tmp_path / f"{i}.json")
+        store.write(registry.snapshot())
+
+    # A worker that stopped writing a while ago
+    old = time.time() - 120
+    os.utime(stores[2].path, (old, old))
+    stores[1].remove()
+
+    merged = merge_snapshots(stores[0].read_all())
+    assert merged["requests_total"]["samples"] == [[[], 1]]
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint(async_client: AsyncClient, created_post: dict):
+    await async_client.get("/post")
+    await async_client.get("/no-such-route")
+
+    response = await async_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert (
+        'blogapi_http_requests_total{method="GET",route="/post",status="200"}' in body
+    )
+    assert 'blogapi_http_requests_total{method="GET",route="-",status="404"}' in body
+    assert 'blogapi_http_requests_in_progress{method="GET"} 1' in body
+    assert 'call_site="blogapi.routers.post.get_all_posts.' in body
+    assert 'call_site="blogapi.routers.post.create_post"' in body
+    assert (
+        'blogapi_job_queue_depth{type="generate_and_add_to_post",status="failed"} 0'
+        in body
+    )
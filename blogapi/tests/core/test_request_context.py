@@ -0,0 +1,21 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from blogapi.core.request_context import RequestContextMiddleware, current_route
+
+
+def test_current_route():
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"route": current_route()}
+
+    response = TestClient(app).get("/items/1")
+
+    assert response.json() == {"route": "/items/{item_id}"}
+
+
+def test_current_route_outside_request():
+    assert current_route() == "-"
@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+
+from blogapi.core.response_cache import (
+    MemoryBackend,
+    RedisBackend,
+    RedisError,
+    StaleWhileRevalidateCache,
+)
+from blogapi.tests.fake_redis import FakeRedis
+
+
+class FakeTimer:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Loader:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self) -> int:
+        self.calls += 1
+        await self.release.wait()
+        return self.calls
+
+
+class BrokenBackend(MemoryBackend):
+    async def get(self, key: str):
+        raise RedisError("GET failed")
+
+    async def incr(self, key: str) -> int:
+        raise RedisError("INCR failed")
+
+
+def make_cache(stale_ttl: float = 0, timer=None) -> StaleWhileRevalidateCache:
+    return StaleWhileRevalidateCache(
+        MemoryBackend(10, ttl=100),
+        namespace="test",
+        ttl=5,
+        stale_ttl=stale_ttl,
+        timer=timer or FakeTimer(),
+    )
+
+
+@pytest.mark.anyio
+async def test_cache_hit():
+    cache = make_cache()
+    load = Loader()
+
+    assert await cache.get("a", load) == 1
+    assert await cache.get("a", load) == 1
+
+    assert load.calls == 1
+    assert {"hits": 1, "misses": 1, "hit_ratio": 0.5}.items() <= cache.stats().items()
+
+
+@pytest.mark.anyio
+async def test_cache_invalidate_without_stale_ttl_reloads():
+    cache = make_cache()
+    load = Loader()
+    await cache.get("a", load)
+
+    await cache.invalidate()
+
+    assert await cache.get("a", load) == 2
+    assert cache.misses == 2
+
+
+@pytest.mark.anyio
+async def test_cache_expires_after_ttl():
+    timer = FakeTimer()
+    cache = make_cache(timer=timer)
+    load = Loader()
+    await cache.get("a", load)
+
+    timer.now = 5
+
+    assert await cache.get("a", load) == 2
+
+
+@pytest.mark.anyio
+async def test_cache_serves_stale_while_refreshing():
+    cache = make_cache(stale_ttl=60)
+    load = Loader()
+    await cache.get("a", load)
+    await cache.invalidate()
+
+    load.release.clear()
+    assert await cache.get("a", load) == 1
+    assert await cache.get("a", load) == 1
+    await asyncio.sleep(0)
+    assert load.calls == 2
+    assert cache.stats()["refreshing"] == 1
+
+    load.release.set()
+    await cache.drain()
+
+    assert await cache.get("a", load) == 2
+    assert {"hits": 1, "stale_hits": 2, "refreshing": 0}.items() <= (
+        cache.stats().items()
+    )
+
+
+@pytest.mark.anyio
+async def test_cache_too_stale_waits_for_load():
+    timer = FakeTimer()
+    cache = make_cache(stale_ttl=60, timer=timer)
+    load = Loader()
+    await cache.get("a", load)
+
+    timer.now = 65
+
+    assert await cache.get("a", load) == 2
+    assert cache.stale_hits == 0
+
+
+@pytest.mark.anyio
+async def test_cache_concurrent_misses_share_load():
+    cache = make_cache()
+    load = Loader()
+    load.release.clear()
+
+    results = asyncio.gather(*(cache.get("a", load) for _ in range(10)))
+    await asyncio.sleep(0)
+    load.release.set()
+
+    assert await results == [1] * 10
+    assert load.calls == 1
+
+
+@pytest.mark.anyio
+async def test_cache_backend_error_falls_back_to_load():
+    cache = StaleWhileRevalidateCache(
+        BrokenBackend(10, ttl=100), namespace="test", ttl=5, stale_ttl=0
+    )
+    load = Loader()
+
+    assert await cache.get("a", load) == 1
+    await cache.invalidate()
+
+    assert cache.errors == 2
+
+
+@pytest.mark.anyio
+async def test_redis_backend():
+    server = await FakeRedis(password="secret").start()
+    backend = RedisBackend(f"{server.url}/2")
+    try:
+        await backend.set("a", {"value": [1, 2]}, ttl=10)
+        assert await backend.get("a") == {"value": [1, 2]}
+        assert await backend.get("missing") is None
+
+        assert await backend.counter("generation") == 0
+        assert await backend.incr("generation") == 1
+        assert await backend.counter("generation") == 1
+
+        assert list(server.data) == [2]
+        assert server.connections == 1
+    finally:
+        await backend.aclose()
+        await server.stop()
+
+
+@pytest.mark.anyio
+async def test_redis_backend_shared_between_caches():
+    server = await FakeRedis().start()
+    backends = [RedisBackend(server.url), RedisBackend(server.url)]
+    caches = [
+        StaleWhileRevalidateCache(backend, namespace="test", ttl=5, stale_ttl=0)
+        for backend in backends
+    ]
+    load = Loader()
+    try:
+        await caches[0].get("a", load)
+        assert await caches[1].get("a", load) == 1
+
+        await caches[1].invalidate()
+        assert await caches[0].get("a", load) == 2
+    finally:
+        for backend in backends:
+            await backend.aclose()
+        await server.stop()
+
+
+@pytest.mark.anyio
+async def test_redis_backend_unreachable():
+    server = await FakeRedis().start()
+    url = server.url
+    await server.stop()
+    backend = RedisBackend(url)
+
+    with pytest.raises(RedisError):
+        await backend.get("a")
@@ -0,0 +1,170 @@
+import pytest
+import sentry_sdk
+from httpx import AsyncClient
+from sentry_sdk.transport import Transport
+
+from blogapi.core.tracing import AdaptiveSampler, traces_sampler
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CapturingTransport(Transport):
+    def __init__(self, options=None) -> None:
+        super().__init__(options)
+        self.transactions: list[str] = []
+
+    def capture_envelope(self, envelope) -> None:
+        event = envelope.get_transaction_event()
+        if event is not None:
+            self.transactions.append(event["transaction"])
+
+
+def context(path: str, method: str = "GET", **extra) -> dict:
+    scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+    return {"asgi_scope": scope, "parent_sampled": None, **extra}
+
+
+@pytest.fixture()
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture()
+def sampler(clock: Clock) -> AdaptiveSampler:
+    sampler = AdaptiveSampler(
+        default_rate=0.5,
+        route_rates={"/post/{post_id}": 0.1},
+        target_per_second=10,
+        slow_threshold=1,
+        boost_for=60,
+        window=1,
+        timer=clock,
+    )
+    sampler.routes = traces_sampler.routes
+    return sampler
+
+
+def test_sampler_uses_route_rates(sampler: AdaptiveSampler):
+    assert sampler(context("/post/1")) == 0.1
+    assert sampler(context("/post")) == 0.5
+    assert sampler(context("/no-such-route")) == 0.5
+
+
+def test_sampler_keeps_parent_decision(sampler: AdaptiveSampler):
+    assert sampler(context("/post/1", parent_sampled=True)) == 1.0
+    assert sampler(context("/post/1", parent_sampled=False)) == 0.0
+
+
+def test_sampler_scales_rates_down_to_budget(sampler: AdaptiveSampler, clock: Clock):
+    # 1000 requests per second asking for 500 traces per second
+    expected_per_window = []
+    for _ in range(5):
+        expected = 0.0
+        for _ in range(1000):
+            expected += sampler(context("/post"))
+            clock.now += 0.001
+        expected_per_window.append(expected)
+
+    assert expected_per_window[0] == pytest.approx(500)
+    for expected in expected_per_window[1:]:
+        assert expected == pytest.approx(10)
+
+    # Back to the base rates once traffic drops below the budget
+    for _ in range(30):
+        sampler(context("/post"))
+        clock.now += 0.1
+    assert sampler(context("/post")) == 0.5
+
+
+def test_sampler_traces_failing_and_slow_routes_in_full(
+    sampler: AdaptiveSampler, clock: Clock
+):
+    sampler.factor = 0.01
+
+    sampler.record("/post/{post_id}", duration=0.1, status_code=404)
+    assert sampler(context("/post/1")) == pytest.approx(0.001)
+
+    sampler.record("/post/{post_id}", duration=0.1, status_code=500)
+    assert sampler(context("/post/1")) == 1.0
+    assert sampler(context("/post")) == pytest.approx(0.005)
+
+    sampler.record("/post", duration=2, status_code=200)
+    assert sampler(context("/post")) == 1.0
+
+    # Quiet since, so back to the base rate too
+    clock.now += 61
+    assert sampler(context("/post/1")) == 0.1
+    assert sampler.stats()["boosted"] == []
+
+
+@pytest.fixture()
+def traced(monkeypatch, clock: Clock):
+    """Sends the app's traces to a CapturingTransport, sampled with a fake clock."""
+    fresh = AdaptiveSampler(
+        default_rate=1.0,
+        route_rates={},
+        target_per_second=10,
+        slow_threshold=1,
+        boost_for=60,
+        window=1,
+        timer=clock,
+    )
+    for name, value in vars(fresh).items():
+        if name != "routes":
+            monkeypatch.setattr(traces_sampler, name, value)
+
+    transport = CapturingTransport()
+    previous = sentry_sdk.get_client()
+    sentry_sdk.init(
+        dsn="https://key@sentry.example.com/1",
+        transport=transport,
+        traces_sampler=traces_sampler,
+    )
+    yield transport
+    sentry_sdk.get_client().close()
+    sentry_sdk.get_global_scope().set_client(previous)
+
+
+async def get_posts(async_client: AsyncClient, clock: Clock, requests: int) -> None:
+    # 100 requests per second on the fake clock
+    for _ in range(requests):
+        await async_client.get("/post")
+        clock.now += 0.01
+
+
+@pytest.mark.anyio
+async def test_fewer_traces_at_high_request_rates(
+    async_client: AsyncClient, traced: CapturingTransport, clock: Clock
+):
+    await get_posts(async_client, clock, 100)
+    full_rate = len(traced.transactions)
+    traced.transactions.clear()
+
+    await get_posts(async_client, clock, 100)
+    adaptive = len(traced.transactions)
+
+    assert full_rate == 100
+    assert set(traced.transactions) <= {"/post"}
+    # Expected 10, 30 or more is vanishingly unlikely
+    assert adaptive < 30
+
+
+@pytest.mark.anyio
+async def test_slow_requests_keep_their_route_traced(
+    async_client: AsyncClient, traced: CapturingTransport, clock: Clock
+):
+    await get_posts(async_client, clock, 100)
+    traced.transactions.clear()
+
+    # Every request now counts as slow
+    traces_sampler.slow_threshold = 0
+    await get_posts(async_client, clock, 100)
+
+    assert traces_sampler.stats()["boosted"] == ["/post"]
+    assert len(traced.transactions) >= 99
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+from collections.abc import AsyncGenerator
+
+import asyncpg
+import pytest
+from asgi_correlation_id import correlation_id
+from fastapi.routing import APIRoute
+from httpx import AsyncClient
+
+from blogapi.core.config import config
+from blogapi.core.deps import get_read_database
+from blogapi.core.logging_conf import SamplingFilter
+from blogapi.core.request_context import request_scope
+from blogapi.database.database import database, user_table
+from blogapi.database.instrumented import (
+    Histogram,
+    InstrumentedDatabase,
+    PoolTimeoutError,
+    RenderedQuery,
+    query_logger,
+    slow_query_logger,
+)
+from blogapi.main import app
+from blogapi.routers.post import find_post
+
+
+@pytest.mark.anyio
+async def test_query_logged_with_params_and_timing(caplog):
+    caplog.set_level(logging.DEBUG, logger=query_logger.name)
+
+    await database.fetch_one(
+        user_table.select().where(user_table.c.email == "test@example.com")
+    )
+
+    [record] = [r for r in caplog.records if r.name == query_logger.name]
+    message = record.getMessage()
+    assert "FROM users" in message
+    assert "test@example.com" in message
+    assert record.duration_ms >= 0
+
+
+@pytest.mark.anyio
+async def test_text_query_logged(caplog):
+    caplog.set_level(logging.DEBUG, logger=query_logger.name)
+
+    await database.fetch_val("SELECT :value", {"value": "x"})
+
+    [record] = [r for r in caplog.records if r.name == query_logger.name]
+    assert "SELECT %(value)s params={'value': 'x'}" in record.getMessage()
+
+
+@pytest.mark.anyio
+async def test_query_not_rendered_unless_emitted(caplog, mocker):
+    render = mocker.spy(RenderedQuery, "__str__")
+
+    caplog.set_level(logging.INFO, logger=query_logger.name)
+    await database.fetch_all(user_table.select())
+
+    caplog.set_level(logging.DEBUG, logger=query_logger.name)
+    sampling = SamplingFilter(rate=0)
+    query_logger.addFilter(sampling)
+    try:
+        await database.fetch_all(user_table.select())
+    finally:
+        query_logger.removeFilter(sampling)
+
+    render.assert_not_called()
+    assert sampling.dropped == 1
+
+
+@pytest.fixture()
+async def small_pool() -> AsyncGenerator[InstrumentedDatabase]:
+    pool = InstrumentedDatabase(
+        config.DATABASE_URL, min_size=1, max_size=1, acquire_timeout=0.05
+    )
+    await pool.connect()
+    yield pool
+    await pool.disconnect()
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+
+    assert histogram.snapshot() == {
+        "buckets": {"0.1": 1, "1": 3, "inf": 4},
+        "sum": 6.05,
+        "count": 4,
+    }
+
+
+@pytest.mark.anyio
+async def test_pool_stats(small_pool: InstrumentedDatabase):
+    async with small_pool.connection() as connection:
+        await connection.fetch_val("SELECT 1")
+        stats = small_pool.pool_stats()
+
+    assert {"size": 1, "in_use": 1, "idle": 0, "max_size": 1}.items() <= stats.items()
+    assert stats["acquire_wait"]["count"] == 1
+    assert small_pool.pool_stats()["in_use"] == 0
+
+
+@pytest.mark.anyio
+async def test_pool_acquire_timeout(small_pool: InstrumentedDatabase):
+    holding = asyncio.Event()
+    release = asyncio.Event()
+
+    async def hold_connection():
+        async with small_pool.connection():
+            holding.set()
+            await release.wait()
+
+    holder = asyncio.create_task(hold_connection())
+    await holding.wait()
+
+    token = request_scope.set({"route": APIRoute("/post/{post_id}", lambda: None)})
+    try:
+        with pytest.raises(PoolTimeoutError):
+            await small_pool.fetch_val("SELECT 1")
+    finally:
+        request_scope.reset(token)
+        release.set()
+        await holder
+
+    assert small_pool.pool_stats()["timeouts"] == {"/post/{post_id}": 1}
+
+
+@pytest.fixture()
+def pool_exhausted():
+    async def timed_out():
+        raise PoolTimeoutError("No database connection free within 10s")
+
+    app.dependency_overrides[get_read_database] = timed_out
+    yield
+    del app.dependency_overrides[get_read_database]
+
+
+@pytest.mark.anyio
+async def test_pool_acquire_timeout_is_503(async_client: AsyncClient, pool_exhausted):
+    response = await async_client.get("/post/1")
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Server is busy, please try again later"}
+
+
+@pytest.mark.anyio
+async def test_statement_timeout_configured():
+    timeout = await database.fetch_val("SHOW statement_timeout")
+
+    assert timeout == f"{int(config.DB_STATEMENT_TIMEOUT)}s"
+
+
+@pytest.fixture()
+def slow_queries(mocker, caplog):
+    mocker.patch.object(database, "slow_query_threshold", 0)
+    caplog.set_level(logging.WARNING, logger=slow_query_logger.name)
+    return lambda: [r for r in caplog.records if r.name == slow_query_logger.name]
+
+
+@pytest.mark.anyio
+async def test_slow_query_logged(slow_queries):
+    token = correlation_id.set("abc123")
+    try:
+        await find_post(42)
+    finally:
+        correlation_id.reset(token)
+
+    [record] = slow_queries()
+    message = record.getMessage()
+    assert record.levelno == logging.WARNING
+    assert record.call_site == "blogapi.routers.post.find_post"
+    assert "in blogapi.routers.post.find_post, request abc123" in message
+    assert "FROM posts" in message
+    assert "'post_id': 42" in message
+    assert "actual time" not in message
+
+
+@pytest.mark.anyio
+async def test_fast_query_not_logged_as_slow(slow_queries, mocker):
+    mocker.patch.object(database, "slow_query_threshold", 10)
+
+    await database.fetch_val("SELECT 1")
+
+    assert slow_queries() == []
+
+
+@pytest.mark.anyio
+async def test_slow_read_explained(slow_queries, mocker):
+    mocker.patch.object(database, "explain_rate", 1)
+
+    await database.fetch_all(
+        user_table.select().where(user_table.c.email == "test@example.com")
+    )
+
+    [record] = slow_queries()
+    assert "actual time=" in record.getMessage()
+
+
+@pytest.mark.anyio
+async def test_slow_write_not_explained(slow_queries, mocker):
+    mocker.patch.object(database, "explain_rate", 1)
+    explain = mocker.spy(database, "explain")
+
+    await database.execute(
+        user_table.insert().values(email="test@example.com", password="x")
+    )
+
+    assert explain.spy_return is None
+    assert "actual time" not in slow_queries()[0].getMessage()
+    assert await database.fetch_val("SELECT count(*) FROM users") == 1
+
+
+@pytest.mark.anyio
+async def test_failed_slow_query_not_explained(slow_queries, mocker):
+    mocker.patch.object(database, "explain_rate", 1)
+    explain = mocker.spy(database, "explain")
+
+    with pytest.raises(asyncpg.UndefinedTableError):
+        await database.fetch_all("SELECT * FROM no_such_table")
+
+    explain.assert_not_called()
+    assert len(slow_queries()) == 1
@@ -0,0 +1,58 @@
+import pytest
+import sqlalchemy
+
+from blogapi.database.database import database, post_table
+from blogapi.database.statements import BoundCompiled, CachedStatement
+
+
+@pytest.fixture()
+def statement() -> CachedStatement:
+    return CachedStatement(
+        "test_post_by_id",
+        post_table.select().where(post_table.c.id == sqlalchemy.bindparam("post_id")),
+    )
+
+
+@pytest.mark.anyio
+async def test_statement_compiled_once(statement: CachedStatement, created_post: dict):
+    found = await database.fetch_one(statement.bind(post_id=created_post["id"]))
+    missing = await database.fetch_one(statement.bind(post_id=created_post["id"] + 1))
+
+    assert found["body"] == created_post["body"]
+    assert missing is None
+    assert statement.compiles == 1
+    assert statement.hits == 1
+
+
+@pytest.mark.anyio
+async def test_statement_missing_parameter(statement: CachedStatement):
+    with pytest.raises(ValueError, match="Missing parameters"):
+        await database.fetch_one(statement.bind())
+
+
+@pytest.mark.anyio
+async def test_statement_unknown_parameter(statement: CachedStatement):
+    with pytest.raises(ValueError, match="Unknown parameters"):
+        await database.fetch_one(statement.bind(post_id=1, user_id=1))
+
+
+def test_statement_rejects_expanding_in():
+    with pytest.raises(ValueError, match="expanding IN"):
+        CachedStatement(
+            "test_posts_by_ids",
+            post_table.select().where(
+                post_table.c.id.in_(sqlalchemy.bindparam("ids", expanding=True))
+            ),
+        )
+
+
+def test_bound_compiled_has_what_databases_reads(statement: CachedStatement):
+    # databases' postgres backend reads these private attributes, a SQLAlchemy
+    # upgrade that drops them breaks every query
+    compiled = statement.bind(post_id=1).compile(database._backend._dialect)
+
+    assert isinstance(compiled, BoundCompiled)
+    assert compiled.params["post_id"] == 1
+    assert "posts.id = " in compiled.string
+    assert isinstance(compiled._bind_processors, dict)
+    assert [column[0] for column in compiled._result_columns][:2] == ["id", "body"]
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import re
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def render(template: str, values: dict) -> str:
+    return re.sub(
+        r"%recipient\.(\w+)%",
+        lambda match: str(values.get(match.group(1), "")),
+        template,
+    )
+
+
+class FakeMailgun:
+    """In-process stand-in for the Mailgun messages API.
+
+    Records every API call and renders the email each recipient would get,
+    substituting %recipient.<name>% from the batch's recipient variables.
+    """
+
+    max_recipients = 1000
+
+    def __init__(self, latency: float = 0.0, status_code: int = 200) -> None:
+        self.latency = latency
+        self.status_code = status_code
+        self.requests = 0
+        self.delivered: list[dict] = []
+        self.app = Starlette(
+            routes=[Route("/v3/{domain}/messages", self.messages, methods=["POST"])]
+        )
+
+    async def messages(self, request: Request) -> JSONResponse:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.status_code != 200:
+            return JSONResponse({"message": "Error"}, status_code=self.status_code)
+
+        form = await request.form(max_fields=self.max_recipients + 10)
+        recipients = form.getlist("to")
+        if not recipients or len(recipients) > self.max_recipients:
+            return JSONResponse({"message": "Bad recipients"}, status_code=400)
+
+        variables = json.loads(form.get("recipient-variables", "{}"))
+        for recipient in recipients:
+            self.delivered.append(
+                {
+                    "to": recipient,
+                    "subject": form["subject"],
+                    "text": render(form["text"], variables.get(recipient, {})),
+                }
+            )
+
+        return JSONResponse({"id": "<fake@mailgun>", "message": "Queued. Thank you."})
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.app),
+            base_url="https://api.mailgun.net/v3",
+        )
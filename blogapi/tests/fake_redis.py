@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from blogapi.core.response_cache import read_reply
+
+
+class FakeRedis:
+    """In-process server speaking enough of the Redis protocol for the cache.
+
+    Supports GET, SET with PX or EX, INCR, SELECT, AUTH and PING. Keys are
+    kept per database number, and every command is recorded in `commands`.
+    """
+
+    def __init__(self, password: str | None = None) -> None:
+        self.password = password
+        self.data: dict[int, dict[bytes, tuple[bytes, float | None]]] = {}
+        self.commands: list[list[bytes]] = []
+        self.connections = 0
+        self.server: asyncio.Server | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}"
+
+    async def start(self) -> "FakeRedis":
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        return self
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections += 1
+        state = {"db": 0, "authenticated": self.password is None}
+        try:
+            while True:
+                command = await read_reply(reader)
+                self.commands.append(command)
+                writer.write(self.reply(state, command))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def reply(self, state: dict, command: list[bytes]) -> bytes:
+        name, *args = command
+        name = name.upper()
+        if name == b"AUTH":
+            if args[-1].decode() != self.password:
+                return b"-WRONGPASS invalid password\r\n"
+            state["authenticated"] = True
+            return b"+OK\r\n"
+        if not state["authenticated"]:
+            return b"-NOAUTH Authentication required\r\n"
+
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"SELECT":
+            state["db"] = int(args[0])
+            return b"+OK\r\n"
+
+        data = self.data.setdefault(state["db"], {})
+        match name:
+            case b"GET":
+                value = self.get(data, args[0])
+                if value is None:
+                    return b"$-1\r\n"
+                return b"$%d\r\n%s\r\n" % (len(value), value)
+            case b"SET":
+                key, value, *options = args
+                expires = None
+                if options:
+                    unit = 1000 if options[0].upper() == b"PX" else 1
+                    expires = time.monotonic() + int(options[1]) / unit
+                data[key] = (value, expires)
+                return b"+OK\r\n"
+            case b"INCR":
+                value = int(self.get(data, args[0]) or 0) + 1
+                data[args[0]] = (str(value).encode(), None)
+                return b":%d\r\n" % value
+        return b"-ERR unknown command\r\n"
+
+    def get(self, data: dict, key: bytes) -> bytes | None:
+        value, expires = data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            del data[key]
+            return None
+        return value
@@ -1,8 +1,20 @@
 import pytest
+import sqlalchemy
 from httpx import AsyncClient
+from sqlalchemy.dialects import postgresql
 
+from blogapi.core.config import config
 from blogapi.core.security import create_access_token
-from blogapi.tests.helpers import create_comment, create_post
+from blogapi.database.database import database, user_table
+from blogapi.routers.post import (
+    PostSorting,
+    find_post_statement,
+    insert_likes,
+    like_buffer,
+    select_feed_page,
+)
+from blogapi.service_tasks.jobs import JobWorker
+from blogapi.tests.helpers import create_comment, create_post, like_post
 
 
 @pytest.fixture()
@@ -45,7 +57,10 @@ async def test_create_post(
 
 @pytest.mark.anyio
 async def test_create_post_with_prompt(
-    async_client: AsyncClient, logged_in_token: str, mock_generate_cute_creature_api
+    async_client: AsyncClient,
+    logged_in_token: str,
+    mock_generate_cute_creature_api,
+    db,
 ):
     body = "Test Post"
 
@@ -61,6 +76,11 @@ async def test_create_post_with_prompt(
         "body": body,
         "image_url": None,
     }.items() <= response.json().items()
+
+    worker = JobWorker(db)
+    await worker.run_once()
+    await worker.drain()
+
     mock_generate_cute_creature_api.assert_called()
 
 
@@ -104,12 +124,55 @@ async def test_like_post(
     assert response.status_code == 201
 
 
+@pytest.mark.anyio
+async def test_like_post_updates_like_count(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    await like_post(created_post["id"], async_client, logged_in_token)
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_like_post_twice(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    like = await like_post(created_post["id"], async_client, logged_in_token)
+
+    response = await async_client.post(
+        "/like",
+        json={"post_id": created_post["id"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == like
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_like_missing_post(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/like",
+        json={"post_id": 2},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 404
+
+
 @pytest.mark.anyio
 async def test_get_all_posts(async_client: AsyncClient, created_post: dict):
     response = await async_client.get("/post")
 
     assert response.status_code == 200
-    assert created_post.items() <= response.json()[0].items()
+    assert created_post.items() <= response.json()["items"][0].items()
+    assert response.json()["next_cursor"] is None
 
 
 @pytest.mark.anyio
@@ -133,7 +196,7 @@ async def test_get_all_posts_sorting(
     assert response.status_code == 200
 
     data = response.json()
-    post_ids = [post["id"] for post in data]
+    post_ids = [post["id"] for post in data["items"]]
 
     assert post_ids == expected_order
 
@@ -150,12 +213,73 @@ async def test_get_all_posts_sort_likes(
     assert response.status_code == 200
 
     data = response.json()
-    post_ids = [post["id"] for post in data]
+    post_ids = [post["id"] for post in data["items"]]
     expected_order = [2, 1]
 
     assert post_ids == expected_order
 
 
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "sorting, expected_order",
+    [
+        ("new", [5, 4, 3, 2, 1]),
+        ("old", [1, 2, 3, 4, 5]),
+        ("most_likes", [4, 2, 5, 3, 1]),
+    ],
+)
+async def test_get_all_posts_paginated(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sorting: str,
+    expected_order: list[int],
+):
+    for i in range(5):
+        await create_post(f"Test Post {i}", async_client, logged_in_token)
+    await like_post(2, async_client, logged_in_token)
+    await like_post(4, async_client, logged_in_token)
+
+    post_ids = []
+    params = {"sorting": sorting, "limit": 2}
+    while True:
+        response = await async_client.get("/post", params=params)
+        assert response.status_code == 200
+
+        data = response.json()
+        assert len(data["items"]) <= 2
+        post_ids += [post["id"] for post in data["items"]]
+
+        if data["next_cursor"] is None:
+            break
+        params["cursor"] = data["next_cursor"]
+
+    assert post_ids == expected_order
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "eyJpZCI6ICJ4In0"])
+async def test_get_all_posts_invalid_cursor(async_client: AsyncClient, cursor: str):
+    response = await async_client.get("/post", params={"cursor": cursor})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_cursor_wrong_sorting(
+    async_client: AsyncClient, logged_in_token: str
+):
+    await create_post("Test Post 1", async_client, logged_in_token)
+    await create_post("Test Post 2", async_client, logged_in_token)
+    response = await async_client.get("/post", params={"limit": 1})
+    cursor = response.json()["next_cursor"]
+
+    response = await async_client.get(
+        "/post", params={"sorting": "old", "cursor": cursor}
+    )
+
+    assert response.status_code == 400
+
+
 @pytest.mark.anyio
 async def test_get_all_posts_wrong_sorting(async_client: AsyncClient):
     response = await async_client.get("/post", params={"sorting": "wrong"})
@@ -197,7 +321,7 @@ async def test_get_comments_on_post(
     response = await async_client.get(f"/post/{created_post['id']}/comment")
 
     assert response.status_code == 200
-    assert response.json() == [created_comment]
+    assert response.json() == {"items": [created_comment], "next_cursor": None}
 
 
 @pytest.mark.anyio
@@ -207,7 +331,36 @@ async def test_get_comments_on_post_empty(
     response = await async_client.get(f"/post/{created_post['id']}/comment")
 
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json() == {"items": [], "next_cursor": None}
+
+
+@pytest.mark.anyio
+async def test_get_comments_on_post_paginated(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    comments = [
+        await create_comment(
+            f"Comment {i}", created_post["id"], async_client, logged_in_token
+        )
+        for i in range(5)
+    ]
+
+    received = []
+    params = {"limit": 2}
+    while True:
+        response = await async_client.get(
+            f"/post/{created_post['id']}/comment", params=params
+        )
+        assert response.status_code == 200
+
+        data = response.json()
+        received += data["items"]
+
+        if data["next_cursor"] is None:
+            break
+        params["cursor"] = data["next_cursor"]
+
+    assert received == comments
 
 
 @pytest.mark.anyio
@@ -220,9 +373,35 @@ async def test_get_post_with_comments(
     assert response.json() == {
         "post": {**created_post, "likes": 0},
         "comments": [created_comment],
+        "next_comment_cursor": None,
     }
 
 
+@pytest.mark.anyio
+async def test_get_post_with_many_comments(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, mocker
+):
+    mocker.patch("blogapi.routers.post.DEFAULT_PAGE_SIZE", 2)
+    comments = [
+        await create_comment(
+            f"Comment {i}", created_post["id"], async_client, logged_in_token
+        )
+        for i in range(3)
+    ]
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    data = response.json()
+
+    assert data["comments"] == comments[:2]
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comment",
+        params={"cursor": data["next_comment_cursor"]},
+    )
+
+    assert response.json()["items"] == comments[2:]
+
+
 @pytest.mark.anyio
 async def test_get_missing_post_with_comments(
     async_client: AsyncClient, created_post: dict, created_comment: dict
@@ -230,3 +409,304 @@ async def test_get_missing_post_with_comments(
     response = await async_client.get("/post/2")
 
     assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_not_modified(
+    async_client: AsyncClient, created_post: dict, mocker
+):
+    response = await async_client.get(f"/post/{created_post['id']}")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"].startswith("public")
+
+    full_query = mocker.spy(database, "fetch_one")
+    response = await async_client.get(
+        f"/post/{created_post['id']}", headers={"If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+    full_query.assert_not_called()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("change", ["comment", "like"])
+async def test_get_post_with_comments_etag_changes(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, change: str
+):
+    response = await async_client.get(f"/post/{created_post['id']}")
+    etag = response.headers["ETag"]
+
+    if change == "comment":
+        await create_comment(
+            "Comment", created_post["id"], async_client, logged_in_token
+        )
+    else:
+        await like_post(created_post["id"], async_client, logged_in_token)
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}", headers={"If-None-Match": etag}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_not_modified(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.get("/post")
+    etag = response.headers["ETag"]
+
+    response = await async_client.get("/post", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = await async_client.get(
+        "/post?sorting=old", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+    await like_post(created_post["id"], async_client, logged_in_token)
+    response = await async_client.get("/post", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_cached_until_invalidated(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, mocker
+):
+    spy = mocker.spy(database, "fetch_all")
+
+    first = await async_client.get("/post")
+    second = await async_client.get("/post")
+
+    assert second.json() == first.json()
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert spy.call_count == 1
+
+    await like_post(created_post["id"], async_client, logged_in_token)
+    response = await async_client.get("/post")
+    assert response.json()["items"][0]["likes"] == 1
+    assert spy.call_count == 2
+
+    await create_post("Second Post", async_client, logged_in_token)
+    response = await async_client.get("/post")
+    assert len(response.json()["items"]) == 2
+    assert spy.call_count == 3
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_signed_in_skips_cache(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, mocker
+):
+    spy = mocker.spy(database, "fetch_all")
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    await async_client.get("/post", headers=headers)
+    await async_client.get("/post", headers=headers)
+
+    assert spy.call_count == 2
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("after", [False, True])
+async def test_most_likes_feed_reads_index_in_order(db, after: bool):
+    query = select_feed_page(PostSorting.most_likes, after)
+    sql = query.compile(dialect=postgresql.dialect(paramstyle="named"))
+    values = {"after_id": 10, "after_likes": 3, "fetch": 21} if after else {"fetch": 21}
+
+    async with database.transaction():
+        # The test tables are nearly empty, make the planner show the plan
+        # it would pick for a big one
+        await database.execute("SET LOCAL enable_seqscan = off")
+        plan = "\n".join(
+            row[0] for row in await database.fetch_all(f"EXPLAIN {sql}", values)
+        )
+
+    assert "ix_posts_like_count_id" in plan
+    assert "Sort" not in plan
+
+
+@pytest.mark.anyio
+async def test_create_comments_bulk(
+    async_client: AsyncClient,
+    created_post: dict,
+    confirmed_user: dict,
+    logged_in_token: str,
+):
+    response = await async_client.post(
+        "/comment/bulk",
+        json=[
+            {"body": "First", "post_id": created_post["id"]},
+            {"body": "Missing", "post_id": 999},
+            {"body": "Second", "post_id": created_post["id"]},
+        ],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "status": 201,
+            "comment": {
+                "id": 1,
+                "body": "First",
+                "post_id": created_post["id"],
+                "user_id": confirmed_user["id"],
+            },
+            "detail": None,
+        },
+        {"status": 404, "comment": None, "detail": "Post not found"},
+        {
+            "status": 201,
+            "comment": {
+                "id": 2,
+                "body": "Second",
+                "post_id": created_post["id"],
+                "user_id": confirmed_user["id"],
+            },
+            "detail": None,
+        },
+    ]
+
+    response = await async_client.get(f"/post/{created_post['id']}/comment")
+    assert [comment["body"] for comment in response.json()["items"]] == [
+        "First",
+        "Second",
+    ]
+
+
+@pytest.mark.anyio
+async def test_create_comments_bulk_too_many(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.post(
+        "/comment/bulk",
+        json=[{"body": "Comment", "post_id": created_post["id"]}] * 1001,
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_like_posts_bulk(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    second_post = await create_post("Second Post", async_client, logged_in_token)
+    existing = await like_post(second_post["id"], async_client, logged_in_token)
+
+    response = await async_client.post(
+        "/like/bulk",
+        json=[
+            {"post_id": created_post["id"]},
+            {"post_id": second_post["id"]},
+            {"post_id": 999},
+            {"post_id": created_post["id"]},
+        ],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["status"] for result in results] == [201, 200, 404, 200]
+    assert results[1]["like"]["id"] == existing["id"]
+    assert results[3]["like"]["id"] == results[0]["like"]["id"]
+    assert results[2]["detail"] == "Post not found."
+
+    response = await async_client.get("/post", params={"sorting": "old"})
+    assert [post["likes"] for post in response.json()["items"]] == [1, 1]
+
+
+@pytest.mark.anyio
+async def test_like_posts_bulk_bumps_counts_of_many_users(db, created_post: dict):
+    await db.execute(
+        user_table.insert().values(
+            [
+                {"email": f"user{i}@example.com", "password": "", "confirmed": True}
+                for i in range(3)
+            ]
+        )
+    )
+    users = await db.fetch_all(sqlalchemy.select(user_table.c.id))
+
+    rows = await db.fetch_all(
+        insert_likes(
+            [{"user_id": user["id"], "post_id": created_post["id"]} for user in users]
+        )
+    )
+
+    assert len(rows) == len(users)
+    post = await db.fetch_one(find_post_statement.bind(post_id=created_post["id"]))
+    assert post["like_count"] == len(users)
+
+
+@pytest.mark.anyio
+async def test_get_posts_by_ids(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    second_post = await create_post("Second Post", async_client, logged_in_token)
+    await like_post(second_post["id"], async_client, logged_in_token)
+
+    response = await async_client.get(
+        "/posts", params={"ids": [second_post["id"], 999, created_post["id"]]}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "items": [
+            {**second_post, "likes": 1},
+            {**created_post, "likes": 0},
+        ],
+        "missing": [999],
+    }
+
+
+@pytest.mark.anyio
+async def test_get_posts_by_ids_repeated(async_client: AsyncClient, created_post: dict):
+    response = await async_client.get(
+        "/posts", params={"ids": [created_post["id"], created_post["id"]]}
+    )
+
+    assert [post["id"] for post in response.json()["items"]] == [created_post["id"]]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("ids", [[], list(range(1, 102))])
+async def test_get_posts_by_ids_invalid_count(async_client: AsyncClient, ids: list):
+    response = await async_client.get("/posts", params={"ids": ids})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_like_post_write_behind(
+    async_client: AsyncClient,
+    created_post: dict,
+    confirmed_user: dict,
+    logged_in_token: str,
+    mocker,
+):
+    mocker.patch.object(config, "LIKE_WRITE_BEHIND", True)
+
+    for post_id in (created_post["id"], created_post["id"], 999):
+        response = await async_client.post(
+            "/like",
+            json={"post_id": post_id},
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+        assert response.status_code == 202
+        assert response.json() == {
+            "id": None,
+            "post_id": post_id,
+            "user_id": confirmed_user["id"],
+        }
+
+    await like_buffer.flush()
+
+    response = await async_client.get("/post")
+    assert response.json()["items"][0]["likes"] == 1
+    assert like_buffer.stats()["dropped"] == 0
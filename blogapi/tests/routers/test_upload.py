@@ -1,40 +1,36 @@
-import contextlib
-import os
+import hashlib
+import io
 import pathlib
 import tempfile
 
 import pytest
+import starlette.formparsers
 from httpx import AsyncClient
 
+from blogapi.database.database import upload_table
+from blogapi.libs.b2 import SizeLimitedReader, UploadTooLargeError
+
 
 @pytest.fixture()
 def sample_image(fs) -> pathlib.Path:
     path = (pathlib.Path(__file__).parent / "assets" / "myfile.png").resolve()
-    fs.create_file(path)
+    fs.create_file(path, contents=b"image bytes")
     return path
 
 
 @pytest.fixture(autouse=True)
-def mock_b2_upload_file(mocker):
-    return mocker.patch(
-        "blogapi.routers.upload.b2_upload_file", return_value="https://fakeurl.com"
-    )
+def mock_b2_upload_stream(mocker):
+    def upload(fileobj, file_name):
+        while fileobj.read(4):
+            pass
+        return f"id-{file_name}", f"https://fakeurl.com/{file_name}"
 
+    return mocker.patch("blogapi.libs.b2.b2_upload_stream", side_effect=upload)
 
-@pytest.fixture(autouse=True)
-def aiofiles_mock_open(mocker, fs):
-    mock_open = mocker.patch("aiofiles.open")
-
-    @contextlib.asynccontextmanager
-    async def async_file_open(fname: str, mode: str = "r"):
-        out_fs_mock = mocker.AsyncMock(name=f"async_file_open:{fname!r}/{mode!r}")
-        with open(fname, mode) as fin:
-            out_fs_mock.read.side_effect = fin.read
-            out_fs_mock.write.side_effect = fin.write
-            yield out_fs_mock
 
-    mock_open.side_effect = async_file_open
-    return mock_open
+@pytest.fixture(autouse=True)
+def mock_b2_delete_file(mocker):
+    return mocker.patch("blogapi.libs.b2.b2_delete_file")
 
 
 async def call_upload_endpoint(
@@ -54,18 +50,153 @@ async def test_upload_image(
     response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
 
     assert response.status_code == 201
-    assert response.json()["file_url"] == ["https://fakeurl.com"]
+    assert response.json()["file_url"].startswith("https://fakeurl.com/")
+    assert response.json()["file_url"].endswith(".png")
 
 
 @pytest.mark.anyio
-async def test_temp_file_removed_after_upload(
+async def test_upload_same_image_twice(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sample_image: pathlib.Path,
+    mock_b2_upload_stream,
+    mock_b2_delete_file,
+    db,
+):
+    first = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+    second = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
+    assert first.json()["file_url"] == second.json()["file_url"]
+    # Hashed while streaming, so the duplicate is only found after uploading
+    assert mock_b2_upload_stream.call_count == 2
+    duplicate_name = mock_b2_upload_stream.call_args[0][1]
+    mock_b2_delete_file.assert_called_once_with(f"id-{duplicate_name}", duplicate_name)
+
+    upload = await db.fetch_one(upload_table.select())
+    assert upload["sha256"] == hashlib.sha256(b"image bytes").hexdigest()
+    assert upload["size"] == len(b"image bytes")
+
+
+@pytest.mark.anyio
+async def test_upload_does_not_create_temp_file(
     async_client: AsyncClient, logged_in_token: str, sample_image: pathlib.Path, mocker
 ):
+    # Above Starlette's 1MB in-memory limit for form files, and above the
+    # request bodies Sentry reads for its events
+    sample_image.write_bytes(b"x" * 2 * 1024 * 1024)
     named_temp_file_spy = mocker.spy(tempfile, "NamedTemporaryFile")
+    spooled_file_spy = mocker.spy(starlette.formparsers, "SpooledTemporaryFile")
 
     response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
     assert response.status_code == 201
+    named_temp_file_spy.assert_not_called()
+    spooled_file_spy.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_upload_too_large(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sample_image: pathlib.Path,
+    mocker,
+    db,
+):
+    mocker.patch("blogapi.routers.upload.config.MAX_UPLOAD_SIZE", 4)
+
+    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
+    assert response.status_code == 413
+    assert await db.fetch_one(upload_table.select()) is None
+
+
+@pytest.mark.anyio
+async def test_upload_too_large_by_content_length(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sample_image: pathlib.Path,
+    mock_b2_upload_stream,
+    mocker,
+):
+    mocker.patch("blogapi.routers.upload.config.MAX_UPLOAD_SIZE", 4)
+    mocker.patch("blogapi.routers.upload.MULTIPART_OVERHEAD", 0)
+
+    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
+    assert response.status_code == 413
+    mock_b2_upload_stream.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_upload_without_file_field(async_client: AsyncClient):
+    response = await async_client.post("/upload", files={"other": b"image bytes"})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_upload_without_filename(async_client: AsyncClient):
+    body = (
+        b"--boundary\r\n"
+        b'Content-Disposition: form-data; name="file"\r\n'
+        b"\r\n"
+        b"image bytes\r\n"
+        b"--boundary--\r\n"
+    )
+
+    response = await async_client.post(
+        "/upload",
+        content=body,
+        headers={"Content-Type": "multipart/form-data; boundary=boundary"},
+    )
+
+    assert response.status_code == 201
+    assert "." not in response.json()["file_url"].rsplit("/", 1)[1]
+
+
+@pytest.mark.anyio
+async def test_upload_body_ending_early(async_client: AsyncClient, db):
+    body = (
+        b"--boundary\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="a.png"\r\n'
+        b"\r\n"
+        b"image bytes"
+    )
+
+    response = await async_client.post(
+        "/upload",
+        content=body,
+        headers={"Content-Type": "multipart/form-data; boundary=boundary"},
+    )
+
+    assert response.status_code == 400
+    assert await db.fetch_one(upload_table.select()) is None
+
+
+@pytest.mark.anyio
+async def test_upload_not_multipart(async_client: AsyncClient):
+    response = await async_client.post("/upload", json={"file": "image bytes"})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_upload_error(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sample_image: pathlib.Path,
+    mock_b2_upload_stream,
+):
+    mock_b2_upload_stream.side_effect = RuntimeError("B2 is down")
+
+    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
+    assert response.status_code == 500
+
 
-    created_temp_file = named_temp_file_spy.spy_return
+def test_size_limited_reader():
+    reader = SizeLimitedReader(io.BytesIO(b"12345678"), max_size=6)
 
-    assert not os.path.exists(created_temp_file.name)
+    assert reader.read(4) == b"1234"
+    with pytest.raises(UploadTooLargeError):
+        reader.read(4)
@@ -1,7 +1,10 @@
 import pytest
-from fastapi import BackgroundTasks
 from httpx import AsyncClient
 
+from blogapi.core.deps import get_current_user
+from blogapi.core.security import create_access_token
+from blogapi.service_tasks import jobs
+
 
 async def register_user(async_client: AsyncClient, email: str, password: str):
     """Helper function to register a user."""
@@ -33,7 +36,7 @@ async def test_register_user_already_exists(
 
 @pytest.mark.anyio
 async def test_confirm_user(async_client: AsyncClient, mocker):
-    spy = mocker.spy(BackgroundTasks, "add_task")
+    spy = mocker.spy(jobs, "enqueue")
     await register_user(async_client, "test@example.com", "1234")
 
     confirmation_url = str(spy.call_args[1]["confirmation_url"])
@@ -42,6 +45,19 @@ async def test_confirm_user(async_client: AsyncClient, mocker):
     assert "User confirmed" in response.json()["detail"]
 
 
+@pytest.mark.anyio
+async def test_confirm_user_invalidates_cached_user(async_client: AsyncClient, mocker):
+    spy = mocker.spy(jobs, "enqueue")
+    await register_user(async_client, "test@example.com", "1234")
+    token = create_access_token("test@example.com")
+
+    assert not (await get_current_user(token))["confirmed"]
+
+    await async_client.get(str(spy.call_args[1]["confirmation_url"]))
+
+    assert (await get_current_user(token))["confirmed"]
+
+
 @pytest.mark.anyio
 async def test_confirm_user_invalid_token(async_client: AsyncClient):
     response = await async_client.get("/confirm/invalid_token")
@@ -52,7 +68,7 @@ async def test_confirm_user_invalid_token(async_client: AsyncClient):
 @pytest.mark.anyio
 async def test_confirm_user_expired_token(async_client: AsyncClient, mocker):
     mocker.patch("blogapi.core.security.confirm_token_expire_minutes", return_value=-1)
-    spy = mocker.spy(BackgroundTasks, "add_task")
+    spy = mocker.spy(jobs, "enqueue")
     await register_user(async_client, "test@example.com", "1234")
 
     confirmation_url = str(spy.call_args[1]["confirmation_url"])
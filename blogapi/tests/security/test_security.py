@@ -2,21 +2,26 @@ import pytest
 from fastapi import HTTPException
 from jose import jwt
 
+from blogapi.core import deps
 from blogapi.core.deps import (
     authenticate_user,
     get_current_user,
     get_subject_for_token_type,
     get_user,
+    user_cache,
 )
 from blogapi.core.security import (
     ALGORITHM,
     SECRET_KEY,
+    PasswordHashPool,
     access_token_expire_minutes,
     confirm_token_expire_minutes,
     create_access_token,
     create_confirmation_token,
     get_password_hash,
+    get_password_hash_async,
     verify_password,
+    verify_password_async,
 )
 
 
@@ -104,6 +109,26 @@ def test_get_password_hash():
     assert verify_password(password, get_password_hash(password))
 
 
+@pytest.mark.anyio
+async def test_get_password_hash_async():
+    password = "testpassword"
+    hashed_password = await get_password_hash_async(password)
+
+    assert await verify_password_async(password, hashed_password)
+    assert not await verify_password_async("wrong password", hashed_password)
+
+
+@pytest.mark.anyio
+async def test_password_hash_pool_rejects_when_full():
+    pool = PasswordHashPool(max_workers=1, max_pending=0)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await pool.run(get_password_hash, "testpassword")
+
+    assert exc_info.value.status_code == 503
+    assert pool.stats()["rejected"] == 1
+
+
 @pytest.mark.anyio
 async def test_get_user(registered_user: dict):
     user = await get_user(registered_user["email"])
@@ -145,6 +170,19 @@ async def test_get_current_user(registered_user: dict):
     assert user["email"] == registered_user["email"]
 
 
+@pytest.mark.anyio
+async def test_get_current_user_is_cached(registered_user: dict, mocker):
+    spy = mocker.spy(deps, "get_user")
+    token = create_access_token(registered_user["email"])
+
+    await get_current_user(token)
+    user = await get_current_user(token)
+
+    assert user["email"] == registered_user["email"]
+    assert spy.call_count == 1
+    assert user_cache.stats()["hits"] >= 1
+
+
 @pytest.mark.anyio
 async def test_get_current_user_invalid_token():
     with pytest.raises(HTTPException):
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from blogapi.core.config import config
+from blogapi.core.http_clients import http_clients
+from blogapi.service_tasks import tasks
+from blogapi.service_tasks.email_outbox import EmailOutbox
+from blogapi.service_tasks.tasks import APIResponseError, send_batch_email
+from blogapi.tests.fake_mailgun import FakeMailgun
+
+
+@pytest.fixture()
+def fake_mailgun(mocker) -> FakeMailgun:
+    fake = FakeMailgun()
+    mocker.patch.object(config, "MAILGUN_DOMAIN", "example.com")
+    mocker.patch.object(config, "MAILGUN_API_KEY", "key")
+    mocker.patch.object(http_clients, "get", return_value=fake.client())
+    return fake
+
+
+@pytest.mark.anyio
+async def test_outbox_sends_one_batch(fake_mailgun: FakeMailgun):
+    outbox = EmailOutbox(send_batch_email, window=0.01)
+
+    await asyncio.gather(
+        *(
+            outbox.send(
+                f"user{i}@example.com",
+                "Subject",
+                "Hi %recipient.name%",
+                {"name": f"User {i}"},
+            )
+            for i in range(3)
+        )
+    )
+
+    assert fake_mailgun.requests == 1
+    assert sorted(message["text"] for message in fake_mailgun.delivered) == [
+        "Hi User 0",
+        "Hi User 1",
+        "Hi User 2",
+    ]
+    assert outbox.stats() == {"pending": 0, "batches_sent": 1, "messages_sent": 3}
+
+
+@pytest.mark.anyio
+async def test_outbox_splits_batches(fake_mailgun: FakeMailgun):
+    outbox = EmailOutbox(send_batch_email, window=0.01, max_batch_size=2)
+
+    await asyncio.gather(
+        *(outbox.send(f"user{i}@example.com", "Subject", "Hi", {}) for i in range(5))
+    )
+
+    assert fake_mailgun.requests == 3
+    assert len(fake_mailgun.delivered) == 5
+
+
+@pytest.mark.anyio
+async def test_outbox_batches_per_template(fake_mailgun: FakeMailgun):
+    outbox = EmailOutbox(send_batch_email, window=0.01)
+
+    await asyncio.gather(
+        outbox.send("a@example.com", "Subject", "Hi", {}),
+        outbox.send("b@example.com", "Other subject", "Hi", {}),
+    )
+
+    assert fake_mailgun.requests == 2
+
+
+@pytest.mark.anyio
+async def test_outbox_send_error(fake_mailgun: FakeMailgun):
+    fake_mailgun.status_code = 500
+    outbox = EmailOutbox(send_batch_email, window=0.01)
+
+    results = await asyncio.gather(
+        outbox.send("a@example.com", "Subject", "Hi", {}),
+        outbox.send("b@example.com", "Subject", "Hi", {}),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, APIResponseError) for result in results)
+
+
+@pytest.mark.anyio
+async def test_outbox_flush(fake_mailgun: FakeMailgun):
+    outbox = EmailOutbox(send_batch_email, window=60)
+    send = asyncio.create_task(outbox.send("a@example.com", "Subject", "Hi", {}))
+    await asyncio.sleep(0)
+
+    await outbox.flush()
+    await send
+
+    assert fake_mailgun.requests == 1
+
+
+@pytest.mark.anyio
+async def test_send_user_registration_email(fake_mailgun: FakeMailgun, mocker):
+    mocker.patch.object(tasks.email_outbox, "window", 0.01)
+
+    await tasks.send_user_registration_email(
+        "test@example.com", "http://example.com/confirm/token"
+    )
+
+    [message] = fake_mailgun.delivered
+    assert message["to"] == "test@example.com"
+    assert "Hi test@example.com!" in message["text"]
+    assert "http://example.com/confirm/token" in message["text"]
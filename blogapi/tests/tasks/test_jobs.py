@@ -0,0 +1,147 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from databases import Database
+
+from blogapi.database.database import job_table
+from blogapi.service_tasks.jobs import (
+    JobType,
+    JobWorker,
+    collect_queue_depth,
+    enqueue,
+    job_queue_depth,
+    queue_depth,
+    retry_delay,
+)
+
+
+@pytest.fixture()
+def calls() -> list:
+    return []
+
+
+@pytest.fixture()
+def job_types(calls: list) -> dict[str, JobType]:
+    async def record(database: Database, **payload):
+        calls.append(payload)
+
+    async def explode(database: Database, **payload):
+        raise RuntimeError("boom")
+
+    return {
+        "send_user_registration_email": JobType(record, concurrency=2),
+        "generate_and_add_to_post": JobType(explode, concurrency=1, max_attempts=2),
+    }
+
+
+async def get_job(db: Database, job_id: int):
+    return await db.fetch_one(job_table.select().where(job_table.c.id == job_id))
+
+
+@pytest.mark.anyio
+async def test_run_job(db: Database, job_types: dict, calls: list):
+    job_id = await enqueue(db, "send_user_registration_email", email="test@example.com")
+    worker = JobWorker(db, job_types)
+
+    assert await worker.run_once() == 1
+    await worker.drain()
+
+    assert calls == [{"email": "test@example.com"}]
+    assert await get_job(db, job_id) is None
+    assert worker.stats()["completed"]["send_user_registration_email"] == 1
+
+
+@pytest.mark.anyio
+async def test_run_once_respects_concurrency(db: Database, job_types: dict):
+    for _ in range(3):
+        await enqueue(db, "send_user_registration_email", email="test@example.com")
+    worker = JobWorker(db, job_types)
+    worker.active["send_user_registration_email"] = 1
+
+    assert await worker.run_once() == 1
+    await worker.drain()
+
+
+@pytest.mark.anyio
+async def test_failed_job_is_retried_with_backoff(db: Database, job_types: dict):
+    job_id = await enqueue(db, "generate_and_add_to_post", post_id=1)
+    worker = JobWorker(db, job_types)
+
+    await worker.run_once()
+    await worker.drain()
+
+    job = await get_job(db, job_id)
+    assert job["status"] == "queued"
+    assert job["attempts"] == 1
+    assert "boom" in job["last_error"]
+    assert job["run_at"] > datetime.now(UTC)
+
+    # Not due yet
+    assert await worker.run_once() == 0
+
+
+@pytest.mark.anyio
+async def test_job_fails_after_max_attempts(db: Database, job_types: dict):
+    job_id = await enqueue(db, "generate_and_add_to_post", post_id=1)
+    worker = JobWorker(db, job_types)
+
+    for _ in range(2):
+        await db.execute(
+            job_table.update()
+            .where(job_table.c.id == job_id)
+            .values(run_at=datetime.now(UTC) - timedelta(hours=1))
+        )
+        await worker.run_once()
+        await worker.drain()
+
+    job = await get_job(db, job_id)
+    assert job["status"] == "failed"
+    assert job["attempts"] == 2
+    assert await queue_depth(db) == {"generate_and_add_to_post": {"failed": 1}}
+
+
+@pytest.mark.anyio
+async def test_queue_depth(db: Database):
+    await enqueue(db, "send_user_registration_email", email="a@example.com")
+    await enqueue(db, "send_user_registration_email", email="b@example.com")
+
+    assert await queue_depth(db) == {"send_user_registration_email": {"queued": 2}}
+
+
+@pytest.mark.anyio
+async def test_collect_queue_depth(db: Database):
+    await enqueue(db, "send_user_registration_email", email="a@example.com")
+
+    await collect_queue_depth(db)
+
+    assert job_queue_depth.values[("send_user_registration_email", "queued")] == 1
+    assert job_queue_depth.values[("generate_and_add_to_post", "queued")] == 0
+
+
+@pytest.mark.anyio
+async def test_requeue_stale_fails_jobs_out_of_attempts(db: Database, job_types: dict):
+    worker = JobWorker(db, job_types=job_types)
+    lost = datetime.now(UTC) - timedelta(days=1)
+    retried = await enqueue(db, "generate_and_add_to_post", post_id=1, prompt="a")
+    used_up = await enqueue(db, "generate_and_add_to_post", post_id=2, prompt="b")
+    await db.execute(
+        job_table.update().values(status="running", locked_at=lost, attempts=1)
+    )
+    await db.execute(
+        job_table.update().where(job_table.c.id == used_up).values(attempts=2)
+    )
+
+    await worker.requeue_stale()
+
+    assert (await get_job(db, retried))["status"] == "queued"
+    job = await get_job(db, used_up)
+    assert job["status"] == "failed"
+    assert job["last_error"] == "Worker lost the job"
+    assert worker.stats()["failed"]["generate_and_add_to_post"] == 1
+
+
+def test_retry_delay(mocker):
+    mocker.patch("blogapi.service_tasks.jobs.config.JOB_RETRY_BASE_DELAY", 10)
+    mocker.patch("blogapi.service_tasks.jobs.config.JOB_RETRY_MAX_DELAY", 60)
+
+    assert [retry_delay(attempt) for attempt in range(1, 5)] == [10, 20, 40, 60]
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from blogapi.service_tasks.like_buffer import LikeBuffer
+
+
+class FakeWriter:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.batches: list[list[tuple[int, int]]] = []
+
+    async def __call__(self, likes: list[tuple[int, int]]) -> None:
+        if self.fail:
+            raise ConnectionError("database is down")
+        self.batches.append(likes)
+
+
+@pytest.mark.anyio
+async def test_like_buffer_writes_after_window():
+    writer = FakeWriter()
+    buffer = LikeBuffer(writer, window=0.01, max_size=100)
+
+    buffer.add(1, 10)
+    buffer.add(2, 10)
+    assert writer.batches == []
+
+    await asyncio.sleep(0.05)
+
+    assert writer.batches == [[(1, 10), (2, 10)]]
+    assert {"pending": 0, "batches_written": 1, "likes_written": 2}.items() <= (
+        buffer.stats().items()
+    )
+
+
+@pytest.mark.anyio
+async def test_like_buffer_deduplicates():
+    writer = FakeWriter()
+    buffer = LikeBuffer(writer, window=10, max_size=100)
+
+    buffer.add(1, 10)
+    buffer.add(1, 10)
+    buffer.add(1, 11)
+    await buffer.flush()
+
+    assert writer.batches == [[(1, 10), (1, 11)]]
+
+
+@pytest.mark.anyio
+async def test_like_buffer_writes_full_batch():
+    writer = FakeWriter()
+    buffer = LikeBuffer(writer, window=10, max_size=2)
+
+    for user_id in range(5):
+        buffer.add(user_id, 10)
+    await asyncio.sleep(0)
+
+    assert writer.batches == [[(0, 10), (1, 10)], [(2, 10), (3, 10)]]
+    assert buffer.stats()["pending"] == 1
+
+    await buffer.flush()
+    assert writer.batches[-1] == [(4, 10)]
+
+
+@pytest.mark.anyio
+async def test_like_buffer_drops_failed_batch():
+    writer = FakeWriter(fail=True)
+    buffer = LikeBuffer(writer, window=10, max_size=100)
+
+    buffer.add(1, 10)
+    buffer.add(2, 10)
+    await buffer.flush()
+
+    assert buffer.stats()["dropped"] == 2
+    assert buffer.stats()["likes_written"] == 0
+
+    writer.fail = False
+    buffer.add(3, 10)
+    await buffer.flush()
+    assert writer.batches == [[(3, 10)]]
+
+
+@pytest.mark.anyio
+async def test_like_buffer_flush_empty():
+    writer = FakeWriter()
+    buffer = LikeBuffer(writer, window=10, max_size=100)
+
+    await buffer.flush()
+
+    assert writer.batches == []
@@ -2,11 +2,12 @@ import httpx
 import pytest
 from databases import Database
 
-from blogapi.database.database import post_table
+from blogapi.database.database import like_table, post_table
 from blogapi.service_tasks.tasks import (
     APIResponseError,
     _generate_cute_creature_api,
     generate_and_add_to_post,
+    reconcile_like_counts,
     send_simple_email,
 )
 
@@ -75,6 +76,9 @@ async def test_generate_and_add_to_post_success(
     mock_httpx_client.post.return_value = httpx.Response(
         status_code=200, json=json_data, request=httpx.Request("POST", "//")
     )
+    query = post_table.select().where(post_table.c.id == created_post["id"])
+    original_post = await db.fetch_one(query)
+
     await generate_and_add_to_post(
         confirmed_user["email"],
         created_post["id"],
@@ -83,9 +87,27 @@ async def test_generate_and_add_to_post_success(
         "A cat",
     )
 
-    query = post_table.select().where(post_table.c.id == created_post["id"])
-
     updated_post = await db.fetch_one(query)
 
     assert updated_post is not None, "Post not found"
     assert updated_post["image_url"] == json_data["output_url"]
+    assert updated_post["version"] > original_post["version"]
+
+
+@pytest.mark.anyio
+async def test_reconcile_like_counts(
+    created_post: dict, confirmed_user: dict, db: Database
+):
+    await db.execute(
+        like_table.insert().values(
+            post_id=created_post["id"], user_id=confirmed_user["id"]
+        )
+    )
+
+    assert await reconcile_like_counts(db) == 1
+    assert await reconcile_like_counts(db) == 0
+
+    query = post_table.select().where(post_table.c.id == created_post["id"])
+    post = await db.fetch_one(query)
+
+    assert post["like_count"] == 1
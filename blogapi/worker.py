@@ -0,0 +1,42 @@
+"""Standalone background job worker.
+
+Run it with `python -m blogapi.worker` and set JOB_WORKER_IN_PROCESS=False
+for the web app, so slow jobs like image generation never compete with
+request handling.
+"""
+
+import asyncio
+import logging
+import signal
+
+from blogapi.core.http_clients import http_clients
+from blogapi.core.logging_conf import configure_logging, stop_logging
+from blogapi.core.response_cache import feed_cache
+from blogapi.database.database import database
+from blogapi.service_tasks.jobs import JobWorker
+from blogapi.service_tasks.tasks import email_outbox
+
+logger = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    configure_logging()
+    await database.connect()
+
+    worker = JobWorker(database)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        await email_outbox.flush()
+        await feed_cache.backend.aclose()
+        await http_clients.aclose()
+        await database.disconnect()
+        stop_logging()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())